@@ -0,0 +1,342 @@
+""" Offline rank card benchmark suite, needs neither Discord nor Postgres.
+
+    Fixture avatars, backgrounds and badge files are generated from fixed seeds, so every
+    run draws exactly the same cards. It reports the time of every rendering stage, the
+    throughput of `Rank.get_card` through the render workers at several concurrency
+    levels and the peak memory. Run it from the root of the repository, the fonts are
+    loaded from there:
+
+        python -m benchmarks.rank_card
+        python -m benchmarks.rank_card --save-baseline
+        python -m benchmarks.rank_card --compare
+
+    Both default to benchmarks/baseline.json, the committed baseline. Its meta records the
+    commit, Python, Pillow, CPU and worker count it was taken with, timings only compare
+    between runs on the same machine, so take a new one there before comparing elsewhere.
+    --compare exits with 1 when a metric is more than --tolerance percent worse than the baseline.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import PIL
+from PIL import Image
+
+from utils import backgrounds, badges, rank_card, render
+from utils.avatars import AvatarFetcher
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+SEED = 1337
+NAMES = ["ab#0001", "Benchmark#0001", "a_really_long_username_here#9999", "WWWWWWWWWW#1234"]
+BADGE_COLORS = {"boosting": (244, 127, 255), "staff": (88, 101, 242), "developer": (67, 181, 129),
+                "donator": (250, 166, 26), "bug_hunter": (240, 71, 71)}
+ALL_BADGES = tuple(rank_card.BADGE_FLAGS)
+ALL_FLAGS = dict.fromkeys(rank_card.BADGE_FLAGS.values(), True)
+# metric -> True when a higher value is better
+HIGHER_IS_BETTER = {"cards_per_s": True}
+# timings closer than this to the baseline are noise, whatever the percentage.
+NOISE_MS = 0.05
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def _png(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, "png")
+    return buffer.getvalue()
+
+
+def _jpeg(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, "jpeg", quality=90)
+    return buffer.getvalue()
+
+
+class Fixtures:
+    """ Deterministic inputs, written to `directory`. """
+
+    def __init__(self, directory: str) -> None:
+        rng = random.Random(SEED)
+        self.badge_directory = os.path.join(directory, "badges")
+        os.makedirs(self.badge_directory)
+        store = badges.BadgeStore(self.badge_directory)
+        for name, variant in badges.BADGE_URLS:
+            # bigger than BADGE_SIZE so loading them resizes them, like the real ones.
+            color = BADGE_COLORS[name] if variant == "white" else tuple(c // 2 for c in BADGE_COLORS[name])
+            Image.new("RGBA", (64, 64), color + (255,)).save(store.path(name, variant))
+
+        gradient = Image.new("RGB", (128, 128))
+        gradient.putdata([(x * 2, y * 2, 128) for y in range(128) for x in range(128)])
+        noise = Image.frombytes("RGB", (128, 128), bytes(rng.getrandbits(8) for _ in range(128 * 128 * 3)))
+        self.avatars = {"gradient": _png(gradient), "noise": _png(noise)}
+        frames = [gradient.rotate(angle) for angle in range(0, 360, 6)]
+        buffer = BytesIO()
+        frames[0].save(buffer, "gif", save_all=True, append_images=frames[1:], duration=40, loop=0)
+        self.animated_avatar = buffer.getvalue()
+
+        photo = Image.new("RGB", (1200, 300))
+        photo.putdata([((x + rng.randint(0, 40)) % 256, (y * 3) % 256, (x * y) % 256)
+                       for y in range(300) for x in range(1200)])
+        self.background_jpeg = _jpeg(photo)
+        png, brightness = backgrounds.prepare_background(self.background_jpeg)
+        path = os.path.join(directory, "background.png")
+        with open(path, "wb") as file:
+            file.write(png)
+        self.backgrounds = {"default": None, "colour": "#ffffff",
+                            "url": backgrounds.PreparedBackground(path, brightness, "fixture")}
+
+
+def init_worker(badge_directory: str) -> None:
+    rank_card._badges.directory = badge_directory
+    rank_card.warm_up()
+
+
+class FakeAsset:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+class FakeMember:
+    """ The parts of discord.Member the rank card uses. """
+
+    def __init__(self, user_id: int, name: str, avatar: bytes) -> None:
+        self.id = user_id
+        self.name = name
+        self.avatar = f"{user_id:x}"
+        self.color = "#7289da"
+        self._avatar = avatar
+
+    def __str__(self) -> str:
+        return self.name
+
+    def avatar_url_as(self, **kwargs) -> FakeAsset:
+        return FakeAsset(self._avatar)
+
+
+class FakeContext:
+    def __init__(self) -> None:
+        self.bot = type("Bot", (), {})()
+        self.bot.avatars = AvatarFetcher()
+
+
+def measure(func, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {"median_ms": statistics.median(timings), "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))]}
+
+
+def bench_stages(fixtures: Fixtures, repeat: int) -> dict:
+    avatar = Image.open(BytesIO(fixtures.avatars["noise"])).convert("RGBA")
+    url_background = fixtures.backgrounds["url"]
+    decoded_background, _ = rank_card.load_background(url_background)
+    template, text_color = rank_card.card_template(None, "#7289da", ALL_BADGES)
+    photo_template, _ = rank_card.card_template(url_background, "#7289da", ALL_BADGES)
+
+    def font_fit_cold():
+        rank_card.text_width.cache_clear()
+        for name in NAMES:
+            rank_card.fit_font_size(rank_card.USERNAME_FONT, name, 183)
+
+    def font_fit_warm():
+        for name in NAMES:
+            rank_card.fit_font_size(rank_card.USERNAME_FONT, name, 183)
+
+    def template_cold():
+        rank_card.card_template.cache_clear()
+        rank_card.card_template(url_background, "#7289da", ALL_BADGES)
+
+    def draw_card(rebuild: bool):
+        def run():
+            if rebuild:
+                rank_card.card_template.cache_clear()
+            rank_card.draw_card(NAMES[1], 40, 7, 12, avatar, ALL_FLAGS, "#7289da", None, url_background)
+        return run
+
+    stages = {
+        "decode_avatar": lambda: Image.open(BytesIO(fixtures.avatars["noise"])).convert("RGBA"),
+        "decode_background": lambda: rank_card.load_background(url_background),
+        "prepare_background": lambda: backgrounds.prepare_background(fixtures.background_jpeg),
+        "brightness": lambda: backgrounds.calculate_brightness(decoded_background),
+        "font_fit_cold": font_fit_cold,
+        "font_fit_warm": font_fit_warm,
+        "template_cold": template_cold,
+        "badge_paste": lambda: rank_card.paste_badges(template.copy(), text_color, ALL_BADGES),
+        "draw": lambda: rank_card.draw_details(template.copy(), text_color, NAMES[1], 40, 7, 12,
+                                               avatar, text_color),
+        "encode": lambda: rank_card.encode_png(template),
+        "encode_photo": lambda: rank_card.encode_png(photo_template),
+        "draw_card_rebuilt": draw_card(rebuild=True),
+        "draw_card": draw_card(rebuild=False),
+        "draw_animated_card": lambda: rank_card.draw_animated_card(
+            NAMES[1], 40, 7, 12, fixtures.animated_avatar, ALL_FLAGS, "#7289da", None, None),
+    }
+    return {name: measure(func, repeat) for name, func in stages.items()}
+
+
+async def bench_throughput(fixtures: Fixtures, levels: list, cards: int, workers: int) -> dict:
+    renderer = render.RenderService(workers=workers, max_pending=max(levels),
+                                    initializer=functools.partial(init_worker, fixtures.badge_directory))
+    store = badges.BadgeStore(fixtures.badge_directory)
+    store.load()
+    await renderer.start()
+    results = {}
+    try:
+        for level in levels:
+            ctx = FakeContext()
+            members = [FakeMember(index, NAMES[index % len(NAMES)], avatar)
+                       for index, avatar in enumerate(fixtures.avatars.values())]
+            semaphore = asyncio.Semaphore(level)
+            latencies = []
+
+            async def one(index: int):
+                member = members[index % len(members)]
+                rank = rank_card.Rank(ctx, member, is_staff=True, developer=index % 2 == 0)
+                custom = {"background": list(fixtures.backgrounds.values())[index % len(fixtures.backgrounds)]}
+                async with semaphore:
+                    started = time.perf_counter()
+                    # a different xp every time, so nothing is served from the card cache.
+                    await rank.get_card(index, 7, 12, store, custom, renderer)
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+            rank_card.card_cache._cards.clear()
+            started = time.perf_counter()
+            await asyncio.gather(*[one(level * cards + index) for index in range(cards)])
+            elapsed = time.perf_counter() - started
+            latencies.sort()
+            results[str(level)] = {"cards_per_s": cards / elapsed,
+                                   "p50_ms": latencies[len(latencies) // 2],
+                                   "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]}
+    finally:
+        # wait for the workers to exit, their memory use is only reported once they have.
+        renderer.executor.shutdown(wait=True)
+        renderer.shutdown()
+    return results
+
+
+def max_rss_kib(who: str) -> int:
+    """ who is "RUSAGE_SELF" or "RUSAGE_CHILDREN", 0 where it can't be measured. """
+    if resource is None:
+        return 0
+    rss = resource.getrusage(getattr(resource, who)).ru_maxrss
+    # bytes on macOS, KiB everywhere else
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def flatten(results: dict) -> dict:
+    """ {"stages": {"encode": {"median_ms": 1}}} -> {"stages.encode.median_ms": 1} """
+    flat = {}
+    for section in ("stages", "throughput", "memory"):
+        for name, value in results[section].items():
+            if isinstance(value, dict):
+                for metric, number in value.items():
+                    flat[f"{section}.{name}.{metric}"] = number
+            else:
+                flat[f"{section}.{name}"] = value
+    return flat
+
+
+def compare(baseline: dict, results: dict, tolerance: float) -> bool:
+    """ Prints the difference with a baseline, returns False if anything regressed. """
+    old, new = flatten(baseline), flatten(results)
+    if baseline["meta"]["machine"] != results["meta"]["machine"]:
+        print(f"warning: the baseline was recorded on {baseline['meta']['machine']}")
+    print(f"\n{'metric':<42}{'baseline':>12}{'current':>12}{'change':>10}")
+    ok = True
+    for metric in sorted(old.keys() & new.keys()):
+        before, after = old[metric], new[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        worse = -change if HIGHER_IS_BETTER.get(metric.rsplit(".", 1)[-1]) else change
+        flag = ""
+        if metric.endswith("_ms") and abs(after - before) < NOISE_MS:
+            worse = 0.0
+        if worse > tolerance:
+            flag, ok = "  REGRESSION", False
+        print(f"{metric:<42}{before:>12.2f}{after:>12.2f}{change:>+9.1f}%{flag}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=100, help="runs per stage")
+    parser.add_argument("--cards", type=int, default=64, help="cards rendered per concurrency level")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 8, 16], help="concurrency levels")
+    parser.add_argument("--workers", type=int, default=2, help="render worker processes")
+    parser.add_argument("--save-baseline", metavar="PATH", nargs="?", const=BASELINE,
+                        help="write the results to PATH, benchmarks/baseline.json by default")
+    parser.add_argument("--compare", metavar="PATH", nargs="?", const=BASELINE,
+                        help="compare the results with the baseline at PATH, benchmarks/baseline.json by default")
+    parser.add_argument("--tolerance", type=float, default=20.0, help="allowed regression in percent")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = Fixtures(directory)
+        init_worker(fixtures.badge_directory)
+
+        tracemalloc.start()
+        stages = bench_stages(fixtures, args.repeat)
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        throughput = asyncio.get_event_loop().run_until_complete(
+            bench_throughput(fixtures, args.levels, args.cards, args.workers))
+
+    results = {
+        "meta": {"commit": git_commit(), "python": platform.python_version(), "pillow": PIL.__version__,
+                 "machine": f"{platform.machine()} {platform.processor() or platform.system()}",
+                 "cpus": os.cpu_count(), "repeat": args.repeat, "cards": args.cards, "workers": args.workers},
+        "stages": stages,
+        "throughput": throughput,
+        # Pillow allocates pixels outside of tracemalloc, the max RSS includes them.
+        "memory": {"python_peak_kib": python_peak // 1024, "max_rss_kib": max_rss_kib("RUSAGE_SELF"),
+                   "workers_max_rss_kib": max_rss_kib("RUSAGE_CHILDREN")},
+    }
+
+    print(f"{'stage':<22}{'median':>10}{'p95':>10}")
+    for name, timing in stages.items():
+        print(f"{name:<22}{timing['median_ms']:>8.3f}ms{timing['p95_ms']:>8.3f}ms")
+    print(f"\n{'concurrency':<22}{'cards/s':>10}{'p50':>10}{'p95':>10}")
+    for level, numbers in throughput.items():
+        print(f"{level:<22}{numbers['cards_per_s']:>10.1f}{numbers['p50_ms']:>8.1f}ms{numbers['p95_ms']:>8.1f}ms")
+    print("\n" + "  ".join(f"{name}: {value:,} KiB" for name, value in results["memory"].items()))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nsaved the baseline to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        if not compare(baseline, results, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
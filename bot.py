@@ -1,6 +1,7 @@
 import argparse
 import datetime
 import os
+import signal
 
 import aiohttp
 import asyncpg
@@ -9,7 +10,13 @@ import tweepy
 from discord.ext import commands
 
 import config
+from utils.avatars import AvatarFetcher
+from utils.changefeed import APPLICATION_NAME, Change, ChangeFeed
+from utils.counters import SiteCounters
 from utils.help import CustomHelpCommand
+from utils.identity import IdentityCache
+from utils.leaderboard import LeaderboardIndex
+from utils.leveling import XPBuffer
 
 extensions = ["jishaku"]
 
@@ -36,18 +43,50 @@ class Blist(commands.Bot):
         )
         self.staff_roles = {716713561233031239, 716713293330514041,
                             716713498360545352, 716713238955556965, 716713266683969626}
+        self.avatars = AvatarFetcher()
+        self.counters = SiteCounters(self)
+        self.identities = IdentityCache(self)
+        self.leaderboard = LeaderboardIndex(self)
+        self.xp_buffer = XPBuffer(self)
+        self.changes = ChangeFeed(config.db_url)
+        self.changes.subscribe("main_site_bot", self.site_bot_changed)
+        self.changes.subscribe("main_site_user", self.site_user_changed)
+        self.changes.subscribe("main_site_leveling", self.site_leveling_changed)
+        self.changes.on_reset(self.site_reset)
+        self.closing = False
+
+    async def site_bot_changed(self, change: Change):
+        if change.op != "UPDATE":
+            self.identities.invalidate("BOT", change.key)
+        self.counters.invalidate()
+
+    async def site_user_changed(self, change: Change):
+        if change.op != "UPDATE":
+            self.identities.invalidate("USER", change.key)
+            self.xp_buffer.forget([change.key])
+            self.counters.invalidate()
+
+    async def site_leveling_changed(self, change: Change):
+        await self.xp_buffer.reload_user(change.key)
+
+    async def site_reset(self):
+        self.identities.clear()
+        self.counters.invalidate()
+        await self.xp_buffer.flush()
+        self.xp_buffer.clear()
+        await self.leaderboard.reload()
 
     async def on_ready(self):
         self.session = aiohttp.ClientSession()
-        approved_bots = await self.pool.fetchval(
-            "SELECT COUNT(*) FROM main_site_bot WHERE approved = True AND denied = False")
-        users = await self.pool.fetchval("SELECT COUNT(*) FROM main_site_user")
+        if not self.leaderboard.loaded:
+            self.loop.create_task(self.leaderboard.load())
+        counts = await self.counters.get()
         print("---------------------")
         print(f"{self.user} is ready")
         print("---------------------")
-        print(f"{approved_bots} bots")
+        print(f"{counts['approved']} bots")
         print("---------------------")
-        print(f"Watching {users} users")
+        print(f"Watching {counts['users']} users")
         print("---------------------")
         self.uptime = datetime.datetime.utcnow().strftime("%c")
 
@@ -61,10 +100,13 @@ class Blist(commands.Bot):
         self.verification_guild = self.get_guild(734527161289015337)
         if not hasattr(self, "pool"):
             try:
-                self.pool = await asyncpg.create_pool(config.db_url)
+                self.pool = await asyncpg.create_pool(
+                    config.db_url, server_settings={"application_name": APPLICATION_NAME})
             except Exception as error:
                 print("There was a problem connecting to the database")
                 print(f"\n{error}")
+            else:
+                self.changes.start()
         if not hasattr(self, "mod_pool"):
             try:
                 self.mod_pool = await asyncpg.create_pool(config.mod_db_url)
@@ -84,13 +126,39 @@ class Blist(commands.Bot):
         except KeyboardInterrupt:
             await self.stop()
 
+    async def close(self):
+        """ Writes what's still buffered before disconnecting, jsk shutdown and SIGTERM end up here too. """
+        if self.closing:
+            return
+        self.closing = True
+        self.changes.stop()
+        buffers = [self.xp_buffer]
+        events = self.get_cog("Events")
+        if events:
+            buffers.append(events.statuses)
+        for buffer in buffers:
+            try:
+                await buffer.flush()
+            except Exception as error:
+                print(f"Couldn't write buffered changes on shutdown: {error!r}")
+        general = self.get_cog("General")
+        if general:
+            general.renderer.shutdown()
+        await super().close()
+        if hasattr(self, "pool"):
+            await self.pool.close()
+        if hasattr(self, "session"):
+            await self.session.close()
+
     async def stop(self):
-        await self.pool.close()
-        await super().logout()
-        await self.session.close()
+        await self.close()
 
     def run(self):
         loop = self.loop
+        try:
+            loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(self.close()))
+        except NotImplementedError:  # windows
+            pass
         try:
             loop.run_until_complete(self.start())
         except KeyboardInterrupt:
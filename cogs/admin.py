@@ -3,6 +3,7 @@ import datetime
 import importlib
 import os
 import re
+import typing
 from textwrap import dedent as wrap
 
 import config
@@ -11,7 +12,7 @@ import discord
 from discord.ext import commands, flags
 
 from cogs.staff_site import bot_log_embed
-from utils import checks
+from utils import checks, rank_card
 
 
 class Admin(commands.Cog):
@@ -128,7 +129,7 @@ class Admin(commands.Cog):
         join_list = "\n".join(success_text)
         await self.bot.pool.execute("UPDATE main_site_user SET staff = True WHERE id = $1", member.id)
         await self.bot.mod_pool.execute("UPDATE staff SET rank = $1 WHERE userid = $2", web_mod_role.name, member.id)
-        await self.bot.get_command("force_update_staff_embed")(ctx)
+        self.bot.get_cog("Events").schedule_staff_embed()
         await ctx.send(f"Successfully hired {member} ({member.id}).\n\n{join_list}")
 
     @commands.has_permissions(administrator=True)
@@ -216,11 +217,11 @@ class Admin(commands.Cog):
         join_list = "\n".join(success_text)
         await self.bot.mod_pool.execute("DELETE FROM staff WHERE userid = $1", member.id)
         await self.bot.pool.execute("UPDATE main_site_user SET staff = False WHERE id = $1", member.id)
-        await self.bot.get_command("force_update_staff_embed")(ctx)
+        self.bot.get_cog("Events").schedule_staff_embed()
         await ctx.send(f"Successfully fired {member} ({member.id}).\n\n{join_list}")
 
     @commands.has_permissions(administrator=True)
-    @commands.command()
+    @commands.group(invoke_without_command=True)
     async def rr(self, ctx):
         embed = discord.Embed(color=discord.Color.blurple(),
                               title="Assignable Roles", inline=False)
@@ -247,6 +248,36 @@ class Admin(commands.Cog):
         await msg.add_reaction(self.bot.get_emoji(784923587785916487))
         await ctx.send("Done")
 
+    @commands.has_permissions(administrator=True)
+    @rr.command(name="add")
+    async def rr_add(self, ctx, message_id: int, emoji: typing.Union[discord.PartialEmoji, str], *, role: discord.Role):
+        """ Gives `role` to whoever reacts with `emoji` on the message. """
+        await self.bot.get_cog("Events").reaction_roles.add(message_id, emoji, role)
+        await ctx.send(f"Reacting with {emoji} on {message_id} now gives {role.name}.")
+
+    @commands.has_permissions(administrator=True)
+    @rr.command(name="remove")
+    async def rr_remove(self, ctx, message_id: int, emoji: typing.Union[discord.PartialEmoji, str]):
+        if await self.bot.get_cog("Events").reaction_roles.remove(message_id, emoji):
+            return await ctx.send(f"Removed the {emoji} reaction role from {message_id}.")
+        await ctx.send("There's no reaction role for that emoji on that message.")
+
+    @commands.has_permissions(administrator=True)
+    @rr.command(name="list")
+    async def rr_list(self, ctx):
+        roles = self.bot.get_cog("Events").reaction_roles.roles
+        lines = [f"{message_id} | {emoji if not emoji.isdigit() else self.bot.get_emoji(int(emoji)) or emoji} -> "
+                 f"{role.name}" for (message_id, emoji), role in roles.items()]
+        await ctx.send("\n".join(lines) or "There aren't any reaction roles.")
+
+    @commands.has_permissions(administrator=True)
+    @rr.command(name="reload")
+    async def rr_reload(self, ctx):
+        """ Reloads the reaction roles from the database. """
+        reaction_roles = self.bot.get_cog("Events").reaction_roles
+        await reaction_roles.load()
+        await ctx.send(f"Loaded {len(reaction_roles.roles)} reaction roles.")
+
     @commands.has_permissions(administrator=True)
     @commands.command()
     async def set_country(self, ctx, member: discord.Member, *, country):
@@ -262,6 +293,7 @@ class Admin(commands.Cog):
             return await ctx.send("This user is not in the database")
 
         await self.bot.mod_pool.execute("UPDATE staff SET country_code = $1 WHERE userid = $2", iso2, member.id)
+        self.bot.get_cog("Events").schedule_staff_embed()
         await ctx.send("Done")
 
     @commands.has_permissions(administrator=True)
@@ -280,6 +312,7 @@ class Admin(commands.Cog):
             return await ctx.send("This user is not in the database")
 
         await self.bot.mod_pool.execute("UPDATE staff SET rank = $1 WHERE userid = $2", rank, member.id)
+        self.bot.get_cog("Events").schedule_staff_embed()
         await ctx.send("Done")
 
     @commands.has_permissions(administrator=True)
@@ -389,6 +422,46 @@ class Admin(commands.Cog):
                 headers=headers, json=json) as x:
             await ctx.send(f'{await x.json()}')
 
+    @commands.is_owner()
+    @commands.command(aliases=['rankcache'])
+    async def rankstats(self, ctx):
+        """ Shows how the rank card cache and renderer are doing. """
+        stats = rank_card.card_cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        renderer = self.bot.get_cog("General").renderer.stats()
+        embed = discord.Embed(
+            title="Rank card cache",
+            color=discord.Color.blurple(),
+            description=wrap(
+                f"""
+                >>> Cards: ``{stats['cards']}``
+                Size: ``{stats['bytes'] / 1024:,.1f} / {stats['max_bytes'] / 1024:,.0f} KiB``
+                Hits: ``{stats['hits']}`` ({stats['hits'] / lookups * 100 if lookups else 0:.1f}%)
+                Misses: ``{stats['misses']}``
+                Evictions: ``{stats['evictions']}``
+                """
+            )
+        )
+        embed.add_field(name="Renderer", value=wrap(
+            f"""
+            >>> Workers: ``{renderer['workers']}``
+            Pending: ``{renderer['pending']} / {renderer['max_pending']}`` (``{renderer['queued']}`` queued)
+            Rendered: ``{renderer['rendered']}``
+            Rejected (busy): ``{renderer['rejected']}``
+            Failed: ``{renderer['failed']}``
+            Latency: ``p50 {renderer['p50_ms']:.1f}ms | p95 {renderer['p95_ms']:.1f}ms``
+            """
+        ))
+        avatars = self.bot.avatars.stats()
+        embed.add_field(name="Avatars", value=wrap(
+            f"""
+            >>> Cached: ``{avatars['avatars']} / {avatars['max_size']}``
+            Downloading: ``{avatars['downloading']}``
+            Hits: ``{avatars['hits']}`` | Misses: ``{avatars['misses']}``
+            """
+        ))
+        await ctx.send(embed=embed)
+
     @flags.add_flag("-b", "--bot", action='store_true', default=False)
     @flags.add_flag("-s", "--site", action='store_true', default=False)
     @flags.add_flag("-a", "--all", action='store_true', default=False)
@@ -562,9 +635,11 @@ class Admin(commands.Cog):
                 leveling_user = leveling_user[0]
                 if leveling_user["blacklisted"]:
                     await self.bot.pool.execute("UPDATE main_site_leveling SET blacklisted = False WHERE user_id = $1", db_user["unique_id"])
+                    self.bot.xp_buffer.set_blacklisted(user.id, False)
                     await ctx.send(f"Un-Blacklisted {user} from using leveling!")
                 else:
                     await self.bot.pool.execute("UPDATE main_site_leveling SET blacklisted = True WHERE user_id = $1", db_user["unique_id"])
+                    self.bot.xp_buffer.set_blacklisted(user.id, True)
                     await ctx.send(f"Blacklisted {user} from using leveling!")
             except KeyError:
                 return await ctx.send("This user is not in the Leveling Database!")
@@ -577,7 +652,7 @@ class Admin(commands.Cog):
     @commands.command(aliases=['forcestaffembed', 'staffembed', 'staff_embed'])
     async def force_update_staff_embed(self, ctx):
         event_cog = self.bot.get_cog("Events")
-        await event_cog.update_staff_embed(self.bot.main_guild)
+        await event_cog.update_staff_embed(self.bot.main_guild, force=True)
         await ctx.send(f"Updated the staff embed!")
 
     @checks.main_guild_only()
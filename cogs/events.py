@@ -1,4 +1,6 @@
-import datetime
+import asyncio
+import hashlib
+import json
 import random
 import re
 import os
@@ -7,14 +9,35 @@ import traceback
 from operator import ne
 from textwrap import dedent as wrap
 
+import asyncpg
 import config
 import discord
 from discord.ext import commands, tasks, flags
+from utils.membership import MembershipIndex
+from utils.reaction_roles import ReactionRoles
+from utils.review_reminders import ReviewReminders, is_held
+from utils.statuses import StatusBuffer
 from utils.time import time_took
-import pytz
-
-utc = pytz.UTC
 
+# role id -> (table, column) it's mirrored to, the rows are the member's own.
+ROLE_COLUMNS = {
+    716724716299091980: ("main_site_user", "premium"),
+    716722789234638860: ("main_site_user", "bug_hunter"),
+    716713266683969626: ("main_site_user", "administrator"),
+    716713238955556965: ("main_site_user", "administrator"),
+    777575976124547072: ("main_site_bot", "staff"),
+}
+# (table, column) -> tables where everything the member is the main owner of gets the same value.
+PROPAGATED_COLUMNS = {
+    ("main_site_user", "premium"): ("main_site_bot", "main_site_server"),
+}
+# staff rank -> its field on the staff roster, in the order they're shown.
+STAFF_RANKS = {
+    "Senior Administrator": "> Senior Administrators",
+    "Administrator": "> Administrators",
+    "Senior Website Moderator": "> Senior Website Moderators",
+    "Website Moderator": "> Website Moderators",
+}
 
 class Events(commands.Cog):
     def __init__(self, bot):
@@ -22,48 +45,74 @@ class Events(commands.Cog):
         self.old_on_error = bot.on_error
         bot.on_error = self.new_on_error
         self.test_categories = {}
+        self.reaction_roles = ReactionRoles(bot)
+        self.staff_embed_digest = None
+        self.staff_embed_task = None
+        self.statuses = StatusBuffer(bot)
+        self.membership = MembershipIndex(bot)
+        self.reminders = ReviewReminders(bot)
+        bot.loop.create_task(self.load_reaction_roles())
         self.check_join.start()  # pylint: disable=no-member
         self.change_status.start()
         self.update_statuses.start()
-        self.check_bot_testing.start()
+        # a failed write is kept for the next flush, it mustn't stop the loop.
+        self.flush_xp.add_exception_type(asyncpg.PostgresError, asyncpg.InterfaceError)
+        self.flush_xp.start()
+        self.flush_statuses.add_exception_type(asyncpg.PostgresError, asyncpg.InterfaceError)
+        self.flush_statuses.start()
 
     def cog_unload(self):
         self.bot.on_error = self.old_on_error
+        self.check_join.cancel()
+        self.change_status.cancel()
+        self.flush_xp.cancel()
+        self.flush_statuses.cancel()
+        self.update_statuses.cancel()
+        self.reminders.cancel_all()
+        self.bot.loop.create_task(self.bot.xp_buffer.flush())
+        self.bot.loop.create_task(self.statuses.flush())
+
+    def tested_bot(self, category_id: int):
+        """ The id of the bot a test category is for, None if it isn't one. """
+        return next((bot_id for bot_id, category in self.test_categories.items() if category == category_id), None)
+
+    async def load_reaction_roles(self):
+        await self.bot.wait_until_ready()
+        await self.reaction_roles.load()
 
-    async def update_staff_embed(self, guild: discord.Guild):
-        web_mods_query = await self.bot.mod_pool.fetch("SELECT userid, country_code FROM staff WHERE rank = $1",
-                                                       'Website Moderator')
-        senior_web_mod_query = await self.bot.mod_pool.fetch("SELECT userid, country_code FROM staff WHERE rank = $1",
-                                                             'Senior Website Moderator')
-        admins_query = await self.bot.mod_pool.fetch("SELECT userid, country_code FROM staff WHERE rank = $1",
-                                                     'Administrator')
-        senior_admins_query = await self.bot.mod_pool.fetch("SELECT userid, country_code FROM staff WHERE rank = $1",
-                                                            'Senior Administrator')
-        senior_administrators = [
-            f"{guild.get_member(user['userid']).mention} :flag_{str(user['country_code']).lower()}:" for user in
-            senior_admins_query]
-        administrators = [
-            f"{guild.get_member(user['userid']).mention} :flag_{str(user['country_code']).lower()}:" for user in
-            admins_query]
-        senior_website_moderators = [
-            f"{guild.get_member(user['userid']).mention} :flag_{str(user['country_code']).lower()}:" for user in
-            senior_web_mod_query]
-        website_moderators = [
-            f"{guild.get_member(user['userid']).mention} :flag_{str(user['country_code']).lower()}:" for user in
-            web_mods_query]
+    async def update_staff_embed(self, guild: discord.Guild, force: bool = False):
+        """ Publishes the staff roster, unless it's identical to the last one published. """
+        rows = await self.bot.mod_pool.fetch(
+            "SELECT rank, array_agg(userid ORDER BY joinedat) AS userids, "
+            "array_agg(country_code ORDER BY joinedat) AS country_codes "
+            "FROM staff WHERE rank = ANY($1::text[]) GROUP BY rank", list(STAFF_RANKS))
+        ranks = {row['rank']: list(zip(row['userids'], row['country_codes'])) for row in rows}
 
         embed = discord.Embed(color = discord.Color.blurple(), title = "Staff")
-        embed.add_field(name = "> Senior Administrators",
-                        value = "\n".join(senior_administrators) or "None", inline = False)
-        embed.add_field(name = "> Administrators",
-                        value = "\n".join(administrators) or "None", inline = False)
-        embed.add_field(name = "> Senior Website Moderators", value = "\n".join(
-            senior_website_moderators) or "None", inline = False)
-        embed.add_field(name = "> Website Moderators",
-                        value = "\n".join(website_moderators) or "None", inline = False)
+        for rank, field in STAFF_RANKS.items():
+            # members who left still have a mention, it just won't resolve.
+            staff = [f"{getattr(guild.get_member(user_id), 'mention', f'<@{user_id}>')} "
+                     f":flag_{str(country_code).lower()}:" for user_id, country_code in ranks.get(rank, ())]
+            embed.add_field(name = field, value = "\n".join(staff) or "None", inline = False)
+
+        digest = hashlib.sha1(json.dumps(embed.to_dict(), sort_keys = True).encode()).hexdigest()
+        if digest == self.staff_embed_digest and not force:
+            return
         channel = guild.get_channel(716823743644696586)
         message = channel.get_partial_message(723641541486182410)
         await message.edit(embed = embed)
+        self.staff_embed_digest = digest
+
+    def schedule_staff_embed(self, delay: float = 5):
+        """ Updates the staff roster in `delay` seconds, everything that asks for one before then shares it. """
+        if self.staff_embed_task is None:
+            self.staff_embed_task = self.bot.loop.create_task(self.delayed_staff_embed(delay))
+
+    async def delayed_staff_embed(self, delay: float):
+        await asyncio.sleep(delay)
+        # changes made while this one is publishing get their own update.
+        self.staff_embed_task = None
+        await self.update_staff_embed(self.bot.main_guild)
 
     @property
     def error_webhook(self):
@@ -159,95 +208,21 @@ New Message
                 return
             if message.channel.id in ignored_chans:
                 return
-            user = await self.bot.pool.fetch("SELECT * FROM main_site_user WHERE id = $1", message.author.id)
-            if user:
-                user = user[0]
-                leveling_user = await self.bot.pool.fetch("SELECT * FROM main_site_leveling WHERE user_id = $1",
-                                                          user["unique_id"])
-
-                if leveling_user and leveling_user[0]["blacklisted"]:
-                    return
-                else:
-                    pass
-
-                now = datetime.datetime.utcnow().replace(tzinfo = utc)
-                one_minute = now + datetime.timedelta(seconds = 60)
-                xp = random.randint(5, 10)
-
-                if not leveling_user or leveling_user[0]["last_time"] is None:
-                    return await self.bot.pool.execute(
-                        "INSERT INTO main_site_leveling (xp, level, user_id, last_time, blacklisted, xp_bar_color, border_color, background_color) VALUES ($1, 1, $2, $3, False, $4, $5, $6)",
-                        xp, user["unique_id"], one_minute.replace(tzinfo = utc), "", "", "")
-
-                leveling_user = leveling_user[0]
-                if leveling_user["last_time"].replace(tzinfo = utc) is not None and leveling_user["last_time"].replace(
-                        tzinfo = utc) > now:
-                    return
-                else:
-                    await self.bot.pool.execute("UPDATE main_site_leveling SET last_time = $1 WHERE user_id = $2",
-                                                one_minute.replace(tzinfo = utc), user["unique_id"])
-                    await self.bot.pool.execute("UPDATE main_site_leveling SET xp = xp + $1 WHERE user_id = $2", xp,
-                                                user["unique_id"])
-                    await self.lvl_up(user, message)
-
-    async def lvl_up(self, db_user, message):
-        user = await self.bot.pool.fetch("SELECT * FROM main_site_leveling WHERE user_id = $1", db_user["unique_id"])
-        xp = user[0]["xp"]
-        lvl = user[0]["level"]
-        if xp >= lvl * 50:
-            await self.bot.pool.execute("UPDATE main_site_leveling SET level = level + 1, xp = $1 WHERE user_id = $2",
-                                        0, db_user["unique_id"])
-            await message.channel.send(
-                f"Congrats {message.author}, you are now **Level {user[0]['level'] + 1}** :tada:")
+            new_level = await self.bot.xp_buffer.award(message.author.id, random.randint(5, 10))
+            if new_level:
+                await message.channel.send(f"Congrats {message.author}, you are now **Level {new_level}** :tada:")
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
-        if payload.message_id == 780106851961667614:
-            # Updates
-            if payload.emoji.id == 780103995879325696:
-                role = self.bot.main_guild.get_role(716723291011678319)
-                await payload.member.add_roles(role, reason = "Assignable Roles")
-            # NSFW Channel
-            if payload.emoji.name == "🔞":
-                role = self.bot.main_guild.get_role(716723357336338482)
-                await payload.member.add_roles(role, reason = "Assignable Roles")
-            # Giveaways
-            if payload.emoji.id == 780103641519358013:
-                role = self.bot.main_guild.get_role(779891942464421928)
-                await payload.member.add_roles(role, reason = "Assignable Roles")
-            # Polls
-            if payload.emoji.id == 780103746432139274:
-                role = self.bot.main_guild.get_role(750771398636601354)
-                await payload.member.add_roles(role, reason = "Assignable Roles")
-            # Announcements
-            if payload.emoji.id == 780103872668237835:
-                role = self.bot.main_guild.get_role(716723257663029372)
-                await payload.member.add_roles(role, reason = "Assignable Roles")
+        role = self.reaction_roles.get(payload.message_id, payload.emoji)
+        if role is not None and payload.user_id != self.bot.user.id:
+            self.reaction_roles.queue(payload.user_id, role, True)
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload):
-        payload.member = self.bot.main_guild.get_member(payload.user_id)
-        if payload.message_id == 780106851961667614:
-            # Updates
-            if payload.emoji.id == 780103995879325696:
-                role = self.bot.main_guild.get_role(716723291011678319)
-                await payload.member.remove_roles(role, reason = "Assignable Roles")
-            # NSFW Channel
-            if payload.emoji.name == "🔞":
-                role = self.bot.main_guild.get_role(716723357336338482)
-                await payload.member.remove_roles(role, reason = "Assignable Roles")
-            # Giveaways
-            if payload.emoji.id == 780103641519358013:
-                role = self.bot.main_guild.get_role(779891942464421928)
-                await payload.member.remove_roles(role, reason = "Assignable Roles")
-            # Polls
-            if payload.emoji.id == 780103746432139274:
-                role = self.bot.main_guild.get_role(750771398636601354)
-                await payload.member.remove_roles(role, reason = "Assignable Roles")
-            # Announcements
-            if payload.emoji.id == 780103872668237835:
-                role = self.bot.main_guild.get_role(716723257663029372)
-                await payload.member.remove_roles(role, reason = "Assignable Roles")
+        role = self.reaction_roles.get(payload.message_id, payload.emoji)
+        if role is not None and payload.user_id != self.bot.user.id:
+            self.reaction_roles.queue(payload.user_id, role, False)
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
@@ -261,6 +236,7 @@ New Message
             # members = sorted(self.bot.main_guild.members, key = lambda m: m.joined_at)
             # joined_position = list(members).index(member) + 1
         if member.guild == self.bot.main_guild and member.bot:
+            await self.membership.joined(member)
             role = member.guild.get_role(716684129453735936)
             await member.add_roles(role)
 
@@ -281,6 +257,9 @@ New Message
                     self.test_categories[member.id] = category.id
                 except Exception:
                     pass
+                self.reminders.arm(category, member.id)
+                # looked up now while the audit log entry is recent, the bot info shouldn't wait for it.
+                self.bot.loop.create_task(self.reminders.inviter(member))
 
                 bot = await self.bot.pool.fetch("SELECT * FROM main_site_bot WHERE id = $1", member.id)
                 if not bot:
@@ -334,77 +313,52 @@ New Message
                 if role not in after.roles:
                     await after.add_roles(role)
 
-        premium = self.bot.main_guild.get_role(716724716299091980)
-        if premium not in before.roles and premium in after.roles:
-            await self.bot.pool.execute("UPDATE main_site_user SET premium = True WHERE id = $1", before.id)
-            bots = await self.bot.pool.fetch("SELECT * FROM main_site_bot WHERE main_owner = $1", before.id)
-            servers = await self.bot.pool.fetch("SELECT * FROM main_site_server WHERE main_owner = $1", before.id)
-            for bot in bots:
-                await self.bot.pool.execute("UPDATE main_site_bot SET premium = True WHERE id = $1", bot["id"])
-            for server in servers:
-                await self.bot.pool.execute("UPDATE main_site_server SET premium = True WHERE id = $1", server["id"])
-        if premium in before.roles and premium not in after.roles:
-            await self.bot.pool.execute("UPDATE main_site_user SET premium = False WHERE id = $1", before.id)
-            bots = await self.bot.pool.fetch("SELECT * FROM main_site_bot WHERE main_owner = $1", before.id)
-            servers = await self.bot.pool.fetch("SELECT * FROM main_site_server WHERE main_owner = $1", before.id)
-            for bot in bots:
-                await self.bot.pool.execute("UPDATE main_site_bot SET premium = False WHERE id = $1", bot["id"])
-            for server in servers:
-                await self.bot.pool.execute("UPDATE main_site_server SET premium = False WHERE id = $1", server["id"])
-
-        bug_hunter = self.bot.main_guild.get_role(716722789234638860)
-        if bug_hunter not in before.roles and bug_hunter in after.roles:
-            await self.bot.pool.execute("UPDATE main_site_user SET bug_hunter = True WHERE id = $1", before.id)
-        if bug_hunter in before.roles and bug_hunter not in after.roles:
-            await self.bot.pool.execute("UPDATE main_site_user SET bug_hunter = False WHERE id = $1", before.id)
-
-        admin1 = self.bot.main_guild.get_role(716713266683969626)
-        admin2 = self.bot.main_guild.get_role(716713238955556965)
-        if admin1 not in before.roles and admin1 in after.roles:
-            await self.bot.pool.execute("UPDATE main_site_user SET administrator = True WHERE id = $1", before.id)
-        if admin1 in before.roles and admin1 not in after.roles:
-            await self.bot.pool.execute("UPDATE main_site_user SET administrator = False WHERE id = $1", before.id)
-        if admin2 not in before.roles and admin2 in after.roles:
-            await self.bot.pool.execute("UPDATE main_site_user SET administrator = True WHERE id = $1", before.id)
-        if admin2 in before.roles and admin2 not in after.roles:
-            await self.bot.pool.execute("UPDATE main_site_user SET administrator = False WHERE id = $1", before.id)
-
-        if before.bot:
-            staff_bot = self.bot.main_guild.get_role(777575976124547072)
-            if staff_bot not in before.roles and staff_bot in after.roles:
-                await self.bot.pool.execute("UPDATE main_site_bot SET staff = True WHERE id = $1", before.id)
-            if staff_bot in before.roles and staff_bot not in after.roles:
-                await self.bot.pool.execute("UPDATE main_site_bot SET staff = False WHERE id = $1", before.id)
-
-        # staff_roles = [716713266683969626, 716713238955556965,
-        # 716713498360545352, 716713293330514041]
-        set_difference1 = set(before.roles) - set(after.roles)
-        set_difference2 = set(after.roles) - set(before.roles)
-        if list(set_difference2) != []:
-            new_roles = list(set_difference2)
-            if new_roles[0].id not in self.bot.staff_roles:
-                return
-            await self.bot.mod_pool.execute("UPDATE staff SET rank = $1 WHERE userid = $2", new_roles[0].name,
-                                            before.id)
-            await self.update_staff_embed(self.bot.main_guild)
-            if not before.bot:
-                rank_user = self.bot.verification_guild.get_member(before.id)
-                if not rank_user:
-                    return
+        if before.guild.id != self.bot.main_guild.id:
+            return
+        if after.bot and before.status != after.status:
+            self.statuses.mark(after)
+        before_roles = {role.id for role in before.roles}
+        after_roles = {role.id for role in after.roles}
+        if before_roles == after_roles:
+            return
 
-                before_rank = before.top_role.name
-                before_role = discord.utils.get(self.bot.verification_guild.roles, name = str(before_rank))
-                if before_role and before_role in rank_user.roles:
-                    await rank_user.remove_roles(before_role)
+        changed = before_roles ^ after_roles
+        table = "main_site_bot" if after.bot else "main_site_user"
+        # a column is True while the member has any of the roles mapped to it.
+        columns = {}
+        for role_id in changed:
+            if role_id in ROLE_COLUMNS and ROLE_COLUMNS[role_id][0] == table:
+                column = ROLE_COLUMNS[role_id][1]
+                columns[column] = any(ROLE_COLUMNS.get(role) == (table, column) for role in after_roles)
+        if columns:
+            assignments = ", ".join(f"{column} = ${index}" for index, column in enumerate(columns, start=1))
+            await self.bot.pool.execute(f"UPDATE {table} SET {assignments} WHERE id = ${len(columns) + 1}",
+                                        *columns.values(), after.id)
+            for column, value in columns.items():
+                for owned_table in PROPAGATED_COLUMNS.get((table, column), ()):
+                    await self.bot.pool.execute(f"UPDATE {owned_table} SET {column} = $1 WHERE main_owner = $2",
+                                                value, after.id)
+
+        added_staff_roles = [role for role in after.roles if role.id in self.bot.staff_roles - before_roles]
+        if not added_staff_roles:
+            return
+        await self.bot.mod_pool.execute("UPDATE staff SET rank = $1 WHERE userid = $2", max(added_staff_roles).name,
+                                        before.id)
+        self.schedule_staff_embed()
+        if not before.bot:
+            rank_user = self.bot.verification_guild.get_member(before.id)
+            if not rank_user:
+                return
 
-                after_rank = after.top_role.name
-                after_role = discord.utils.get(self.bot.verification_guild.roles, name = str(after_rank))
-                if after_role and after_role not in rank_user.roles:
-                    await rank_user.add_roles(after_role)
+            before_rank = before.top_role.name
+            before_role = discord.utils.get(self.bot.verification_guild.roles, name = str(before_rank))
+            if before_role and before_role in rank_user.roles:
+                await rank_user.remove_roles(before_role)
 
-        # else:
-        #    new_roles = list(set_difference1)
-        #    await self.bot.mod_pool.execute("UPDATE staff SET rank = $1 WHERE userid = $2", new_roles[0].id, before.id)
+            after_rank = after.top_role.name
+            after_role = discord.utils.get(self.bot.verification_guild.roles, name = str(after_rank))
+            if after_role and after_role not in rank_user.roles:
+                await rank_user.add_roles(after_role)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
@@ -413,6 +367,7 @@ New Message
             second_try = second_try.id if second_try else None
             get_category_id = self.test_categories.get(member.id, second_try)
             admin_logs = self.bot.main_guild.get_channel(797186257061937152)
+            self.reminders.cancel(get_category_id)
             if get_category_id:
                 file_name = f'{member.name.replace(" ", "_")}.txt'
                 file = open(file_name, "w")
@@ -434,10 +389,9 @@ New Message
                 file.writelines(all_messages)
                 file.close()
                 reviewed_by = f"{str(reviewed_by.author)} ({reviewed_by.id})" if reviewed_by else "Not Found"
-                # this might not be that accurate.
-                invited_by = await member.guild.audit_logs(limit = 2, action = discord.AuditLogAction.bot_add,
-                                                           before = category.created_at).flatten()
-                invited_by = f"{str(invited_by[0].user)} ({invited_by[0].user.id})" if invited_by else "Not Found"
+                inviter = await self.reminders.inviter(member)
+                self.reminders.inviters.pop(member.id, None)
+                invited_by = f"{str(inviter)} ({inviter.id})" if inviter else "Not Found"
                 review_embed = discord.Embed(
                     title = "Bot reviewed",
                     color = discord.Color.blurple(),
@@ -461,18 +415,26 @@ New Message
                     except Exception:
                         pass
 
-        muted = await self.bot.mod_pool.fetchval("SELECT userid FROM mutes WHERE userid = $1", member.id)
+        mod = self.bot.get_cog("Mod")
+        if mod is not None:
+            muted = await mod.mutes.is_muted(member.id)
+        else:
+            muted = await self.bot.mod_pool.fetchval("SELECT userid FROM mutes WHERE userid = $1", member.id)
         if muted:
             await member.guild.ban(discord.Object(id = member.id), reason = "Left whilst muted")
 
         if member.guild == self.bot.main_guild:
             if member.bot:
+                approved = self.membership.left(member)
                 x = await self.bot.pool.fetch("SELECT * FROM main_site_bot WHERE id = $1", member.id)
                 if x:
                     embed = discord.Embed(
                         description = f"{member} ({member.id}) has left the server and is listed on the site! Use `b!delete` to delete the bot",
                         color = discord.Color.red())
                     await self.bot.get_channel(716727091818790952).send(embed = embed)
+                    if approved:
+                        # that's its alert, check_join doesn't have to report it again.
+                        await self.membership.mark_alerted([member.id])
                     return
             if not member.bot:
                 x = await self.bot.pool.fetch("SELECT * FROM main_site_bot WHERE main_owner = $1", member.id)
@@ -485,6 +447,8 @@ New Message
                             await self.bot.pool.execute("DELETE FROM main_site_review WHERE bot_id=$1", bot_unique_id)
                             await self.bot.pool.execute("DELETE FROM main_site_auditlogaction WHERE bot_id=$1", bot_unique_id)
                             await self.bot.pool.execute("DELETE FROM main_site_bot WHERE id=$1", bot_id)
+                            self.bot.identities.invalidate("BOT", bot_id)
+                            self.bot.counters.invalidate()
                             return
                         bots = " \n".join(
                             [f"{user['username']} (<@{user['id']}>)"])
@@ -516,95 +480,70 @@ New Message
                 testing_bot = discord.utils.get(self.bot.verification_guild.members, name = cat.name)
                 if testing_bot:
                     self.test_categories[testing_bot.id] = cat.id
+                    if not is_held(cat):
+                        self.reminders.arm(cat, testing_bot.id)
 
     @tasks.loop(minutes = 30)
     async def check_join(self):
-        bots = await self.bot.pool.fetch("SELECT id, username, uses_slash_commands FROM main_site_bot WHERE approved = True")
+        """ Reports the approved bots that went missing from the main guild since the last check. """
+        missing = self.membership.pending_alerts()
+        if not missing:
+            return
         channel = self.bot.main_guild.get_channel(716727091818790952)
-        for bot in bots:
-            if bot['id'] == 765175524594548737:
-                return
-            b = self.bot.main_guild.get_member(bot['id'])
-            if not b:
-                embed = discord.Embed(
-                    title = "Bot Has Not Joined!!",
-                    description = "The following bot has not joined the Support Server after getting approved...",
-                    color = discord.Color.red()
-                )
+        pages = [missing[i:i + 10] for i in range(0, len(missing), 10)]
+        for number, page in enumerate(pages, start = 1):
+            embed = discord.Embed(
+                title = "Bots Have Not Joined!!",
+                description = "The following bots have not joined the Support Server after getting approved...",
+                color = discord.Color.red()
+            )
+            for bot_id, username, uses_slash_commands in page:
                 invite_scopes = ("bot",)
-                if bot['uses_slash_commands'] is True:
+                if uses_slash_commands:
                     invite_scopes = ("bot", "applications.commands")
                 invite=str(discord.utils.oauth_url(
-                    bot['id'], guild=self.bot.main_guild, scopes=invite_scopes)) + "&disable_guild_select=true"
+                    bot_id, guild=self.bot.main_guild, scopes=invite_scopes)) + "&disable_guild_select=true"
                 embed.add_field(
-                    name = bot['username'],
-                    value = invite)
-                await channel.send(embed = embed)
+                    name = username,
+                    value = invite,
+                    inline = False)
+            embed.set_footer(text = f"Page {number}/{len(pages)}")
+            await channel.send(embed = embed)
+            await self.membership.mark_alerted(bot_id for bot_id, *_ in page)
+
+    @check_join.before_loop
+    async def before_check_join(self):
+        await self.bot.wait_until_ready()
+        await self.membership.load()
+
+    @tasks.loop(seconds = 30)
+    async def flush_xp(self):
+        await self.bot.xp_buffer.flush()
+
+    @tasks.loop(seconds = 30)
+    async def flush_statuses(self):
+        await self.statuses.flush()
 
     # Minutes = 60 is better than Hours = 1!! This is for you @A Discord User @Soheab_
-    @tasks.loop(minutes = 60)
+    # presence updates keep the statuses current, this only catches the ones that were missed.
+    @tasks.loop(minutes = 360)
     async def update_statuses(self):
-        bots = await self.bot.pool.fetch("SELECT * FROM main_site_bot WHERE approved = True")
-        for bot in bots:
-            member_instance = self.bot.main_guild.get_member(bot["id"])
-            if member_instance is None:
-                break
-            await self.bot.pool.execute("UPDATE main_site_bot SET status = $1 WHERE id = $2",
-                                        str(member_instance.status), bot["id"])
+        await self.statuses.reconcile()
+
+    @update_statuses.before_loop
+    async def before_update_statuses(self):
+        await self.bot.wait_until_ready()
 
     @tasks.loop(minutes = 1)
     async def change_status(self):
-        approved_bots = await self.bot.pool.fetchval(
-            "SELECT COUNT(*) FROM main_site_bot WHERE approved = True AND denied = False")
-        users = await self.bot.pool.fetchval("SELECT COUNT(*) FROM main_site_user")
-        queued_bots = await self.bot.pool.fetchval(
-            "SELECT COUNT(*) FROM main_site_bot WHERE approved = False AND denied = False")
+        counts = await self.bot.counters.get()
         options = [
-            f"with {queued_bots} bots in the queue",
-            f"with {approved_bots} approved bots",
-            f"with {users} total users"
+            f"with {counts['queued']} bots in the queue",
+            f"with {counts['approved']} approved bots",
+            f"with {counts['users']} total users"
         ]
         await self.bot.change_presence(activity = discord.Game(name = random.choice(options)))
 
-    # i agree, @A Trash Coder .
-    @tasks.loop(minutes = 60)
-    async def check_bot_testing(self):
-        queued_bots = await self.bot.pool.fetch("SELECT added, id FROM main_site_bot WHERE approved = False AND denied = False")
-        if not queued_bots:
-            return
-
-        for x in queued_bots:
-            bot_id: int = x['id']
-            if bot_id in self.test_categories.keys():
-                testing_category = self.bot.verification_guild.get_channel(self.test_categories[bot_id])
-                if not testing_category:
-                    return
-
-                bot_member = self.bot.verification_guild.get_member(bot_id)
-                category_created_at = testing_category.created_at.replace(tzinfo = datetime.timezone.utc)
-                testing_hours = time_took(dt = category_created_at, only_hours = True,
-                                          now_dt = datetime.datetime.utcnow().replace(tzinfo = datetime.timezone.utc))
-
-                if int(testing_hours) >= 2:
-                    ovm = [x for x in testing_category.overwrites if isinstance(x, discord.Member) and not x.bot]
-                    if ovm:  # user overwrites, hold command is used.
-                        return
-                    else:
-                        invited_by = await bot_member.guild.audit_logs(
-                            limit = 2, action = discord.AuditLogAction.bot_add,
-                            before = category_created_at.flatten())
-                        invited_by = f" (Invited by {invited_by[0].user.mention})" if invited_by else ""
-                        for channel in testing_category.text_channels:
-                            try:
-                                await channel.send(
-                                    f"Friendly reminder that {bot_member.mention}{invited_by} has been waiting for "
-                                    f"more than {testing_hours} hours without the category being on hold "
-                                    f"via the `b!hold` command. Please use that command if you are waiting for a "
-                                    "response or mention someone who can take over the review from you."
-                                )
-                            except:
-                                pass
-
 
 def setup(bot):
     bot.add_cog(Events(bot))
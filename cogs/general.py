@@ -1,9 +1,8 @@
-from io import BytesIO
 from textwrap import dedent as wrap
 import re
 
 from utils.pages import MainMenu, LeaderboardPage, AnnouncementPage
-from utils import announcements as announce_file, rank_card
+from utils import announcements as announce_file, backgrounds, badges, rank_card, render
 
 import asyncio
 import discord
@@ -14,6 +13,27 @@ class General(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.announcements = announce_file.Announcement
+        self.badges = badges.BadgeStore()
+        self.backgrounds = backgrounds.BackgroundCache()
+        self.renderer = render.RenderService(initializer=rank_card.warm_up)
+        bot.loop.create_task(self.load_assets())
+
+    def cog_unload(self):
+        self.renderer.shutdown()
+
+    async def load_assets(self):
+        await self.badges.setup()
+        await self.renderer.start()
+
+    def badge_flags(self, member):
+        roles = {role.id for role in member.roles}
+        return {
+            "bug_hunter": 716722789234638860 in roles,
+            "donator": 716724716299091980 in roles,
+            "developer": 716684805286133840 in roles,
+            "is_staff": bool(self.bot.staff_roles & roles),
+            "is_boosting": 780121170196037663 in roles,
+        }
 
     @commands.command()
     async def rank(self, ctx, *, member: discord.Member = None):
@@ -30,8 +50,8 @@ class General(commands.Cog):
         if level_user['blacklisted']:
             return await ctx.send(f"{member_name} blacklisted from the leveling system. aka won't receive anymore XP.")
 
-        full_leaderboard = await self.bot.pool.fetch("SELECT * FROM main_site_leveling ORDER BY level DESC, xp DESC")
-        place = full_leaderboard.index(level_user) + 1
+        level_user = self.bot.xp_buffer.pending(member.id, level_user)
+        place = await self.bot.leaderboard.position(level_user['level'], level_user['xp'])
 
         custom = {}
         if level_user['xp_bar_color'] != "":
@@ -43,42 +63,17 @@ class General(commands.Cog):
             if background.startswith("#"):
                 custom['background'] = background
             else:
-                try:
-                    custom['background'] = BytesIO(await (await self.bot.session.get(background)).read())
-                except Exception:
-                    custom['background'] = (44, 44, 44, 255)
-
-        avatar_bytes = BytesIO(await member.avatar_url_as(format="png", size=128).read())
-
-        staff_badge_black = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/FGHODzE.png")).read())
-        dev_badge_black = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/7JtOzav.png")).read())
-        bug_hunter_badge_black = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/gFPFm1g.png")).read())
-        donator_badge_black = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/4Is1fSC.png")).read())
-        boosting_badge_black = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/RmK5Twi.png")).read())
-
-        staff_badge_white = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/KUMkFE7.png")).read())
-        dev_badge_white = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/2TA4C8g.png")).read())
-        bug_hunter_badge_white = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/jClxGTJ.png")).read())
-        donator_badge_white = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/v5bEiYM.png")).read())
-        boosting_badge_white = BytesIO(await (await self.bot.session.get("https://i.adiscorduser.com/RmK5Twi.png")).read())
-
-        rank_instance = rank_card.Rank(
-            bug_hunter = bool(716722789234638860 in [x.id for x in member.roles]),
-            donator = bool(716724716299091980 in [x.id for x in member.roles]),
-            developer = bool(716684805286133840 in [x.id for x in member.roles]),
-            is_staff = bool([x for x in [x for x in self.bot.staff_roles] if x in [x.id for x in member.roles]]),
-            is_boosting = bool(780121170196037663 in [x.id for x in member.roles]),
-            ctx = ctx,
-            member = member,
-        )
-        card = await rank_instance.get_card(
-            xp=level_user['xp'], position=place, level=level_user['level'], avatar_bytes=avatar_bytes, custom=custom,
-            badges_black={'developer': dev_badge_black, 'bug_hunter': bug_hunter_badge_black,
-                          'donator': donator_badge_black, 'staff': staff_badge_black, 'boosting': boosting_badge_black},
-            badges_white={'developer': dev_badge_white, 'bug_hunter': bug_hunter_badge_white,
-                          'donator': donator_badge_white, 'staff': staff_badge_white, 'boosting': boosting_badge_white}
-        )
-        img = discord.File(card, 'rank_card.png')
+                custom['background'] = await self.backgrounds.get(self.bot.session, background) or (44, 44, 44, 255)
+
+        rank_instance = rank_card.Rank(ctx = ctx, member = member, **self.badge_flags(member))
+        try:
+            card, filename = await rank_instance.get_card(
+                xp=level_user['xp'], position=place, level=level_user['level'], custom=custom, badges=self.badges,
+                renderer=self.renderer, animated=member.is_avatar_animated()
+            )
+        except render.RendererBusy:
+            return await ctx.send(f"{ctx.author.name}, I'm busy drawing other rank cards, please try again in a few seconds.")
+        img = discord.File(card, filename)
         await ctx.send(file=img)
 
     @commands.has_role(716724716299091980)
@@ -120,10 +115,15 @@ class General(commands.Cog):
                 set_background = await rank_card.Rank(ctx, ctx.author).customize_rank_card("BACKGROUND",
                                                                                            str(discord.Color.random()))
             else:
-                if not "https://" or "http://" in background:
-                    if not re.search("^#(?:[0-9a-fA-F]{3}){1,2}$", str(background)):
-                        return await ctx.send(f"(background) {ctx.author.name}, "
-                                              f"that does not look like a valid image URL or HEX value (#123456)")
+                if background.startswith(("https://", "http://")):
+                    try:
+                        # stores it resized, so rank doesn't have to download it.
+                        await self.backgrounds.fetch(self.bot.session, background)
+                    except backgrounds.BackgroundError as err:
+                        return await ctx.send(f"(background) {ctx.author.name}, I couldn't use that image: {err}")
+                elif not re.search("^#(?:[0-9a-fA-F]{3}){1,2}$", str(background)):
+                    return await ctx.send(f"(background) {ctx.author.name}, "
+                                          f"that does not look like a valid image URL or HEX value (#123456)")
                 set_background = await rank_card.Rank(ctx, ctx.author).customize_rank_card("BACKGROUND", str(background))
             if set_background[0] is True:
                 if removing:
@@ -406,28 +406,19 @@ class General(commands.Cog):
     @commands.command()
     async def stats(self, ctx):
         """Shows info on Blist"""
-        approved_bots = await self.bot.pool.fetchval(
-            "SELECT COUNT(*) FROM main_site_bot WHERE approved = True AND denied = False")
-        certified_bots = await self.bot.pool.fetchval(
-            "SELECT COUNT(*) FROM main_site_bot WHERE certified = True")
-        queued_bots = await self.bot.pool.fetchval(
-            "SELECT COUNT(*) FROM main_site_bot WHERE approved = False AND denied = False")
-        denied_bots = await self.bot.pool.fetchval(
-            "SELECT COUNT(*) FROM main_site_bot WHERE approved = False AND denied = True")
-        users = await self.bot.pool.fetchval("SELECT COUNT(*) FROM main_site_user")
-        votes = await self.bot.pool.fetchval("SELECT COUNT(*) FROM main_site_vote")
+        counts = await self.bot.counters.get()
 
         embed = discord.Embed(
             title="Blist Stats",
             description=wrap(
                 f"""
-                >>> ``Total Bots:`` {approved_bots + queued_bots + denied_bots}
-                ``Total Approved Bots:`` {approved_bots}
-                ``Total Certified Bots:`` {certified_bots}
-                ``Total Denied Bots:`` {denied_bots}
-                ``Total Queued Bots:`` {queued_bots}
-                ``Total Users:`` {users}
-                ``Total Votes:`` {votes}
+                >>> ``Total Bots:`` {counts['approved'] + counts['queued'] + counts['denied']}
+                ``Total Approved Bots:`` {counts['approved']}
+                ``Total Certified Bots:`` {counts['certified']}
+                ``Total Denied Bots:`` {counts['denied']}
+                ``Total Queued Bots:`` {counts['queued']}
+                ``Total Users:`` {counts['users']}
+                ``Total Votes:`` {counts['votes']}
                 ``Bot Ping:`` {self.bot.latency * 1000:.2f}ms
                 """
             ),
@@ -437,25 +428,25 @@ class General(commands.Cog):
         await ctx.send(embed=embed)
 
     @flags.add_flag("-a", "--all", action='store_true')
+    @flags.add_flag("-i", "--image", action='store_true')
     @commands.command(aliases=["lb"], cls=flags.FlagCommand)
     async def leaderboard(self, ctx, **args):
         """
         Sends the top 5 users on the user leaderboard
         **Args:**
             **--all**/-a - Flag to output everyone on the leaderboard as a menu.
+            **--image**/-i - Flag to send the top 10 as an image.
         """
-        leaderboard = await self.bot.pool.fetch("SELECT * FROM main_site_leveling ORDER BY level DESC, xp DESC")
+        if args['image']:
+            return await self.leaderboard_image(ctx)
+        leaderboard = await self.bot.leaderboard.top(None if args['all'] else 5)
         embed = discord.Embed(title="User Leaderboard", color=discord.Color.blurple(),
                               url="https://blist.xyz/leaderboard/")
         embed.set_thumbnail(url=str(ctx.guild.icon_url))
         place = 0
         for_menu = []
-        leaderboard = leaderboard[:5] if not args['all'] else leaderboard
         for leader in leaderboard:
             place += 1
-            user = await self.bot.pool.fetch("SELECT * FROM main_site_user WHERE unique_id = $1", leader["user_id"])
-            user = user[0]
-
             if place == 1:
                 trophy = ":first_place:"
             elif place == 2:
@@ -466,10 +457,10 @@ class General(commands.Cog):
                 trophy = ":medal:"
 
             if args['all']:
-                for_menu.append((f"{trophy} #{place} - {user['username']}#{user['discriminator']}",
+                for_menu.append((f"{trophy} #{place} - {leader['username']}#{leader['discriminator']}",
                                  f"Level: {leader['level']} | XP: {leader['xp']}"))
 
-            embed.add_field(name=f"{trophy} #{place} - {user['username']}#{user['discriminator']}",
+            embed.add_field(name=f"{trophy} #{place} - {leader['username']}#{leader['discriminator']}",
                             value=f"Level: {leader['level']} | XP: {leader['xp']}", inline=False)
 
         if args['all']:
@@ -479,6 +470,23 @@ class General(commands.Cog):
 
         return await ctx.send(embed=embed)
 
+    async def leaderboard_image(self, ctx):
+        leaders = []
+        for place, leader in enumerate(await self.bot.leaderboard.top(10), start=1):
+            member = self.bot.main_guild.get_member(leader['id'])
+            user = member or self.bot.get_user(leader['id'])
+            badge_names = ()
+            if member is not None:
+                member_flags = self.badge_flags(member)
+                badge_names = tuple(badge for badge, flag in rank_card.BADGE_FLAGS.items() if member_flags[flag])
+            leaders.append((place, user, f"{leader['username']}#{leader['discriminator']}",
+                            leader['level'], leader['xp'], badge_names))
+        try:
+            image = await rank_card.get_leaderboard(self.bot, leaders, self.badges, self.renderer)
+        except render.RendererBusy:
+            return await ctx.send(f"{ctx.author.name}, I'm busy drawing other images, please try again in a few seconds.")
+        await ctx.send(file=discord.File(image, 'leaderboard.png'))
+
     @commands.command()
     async def top(self, ctx):
         """Shows leaderboard information"""
@@ -636,8 +644,8 @@ class General(commands.Cog):
         unique_id = await announce_file._get_unique_id(ctx, "USER", member.id)
         level_user = await self.bot.pool.fetchrow("SELECT * FROM main_site_leveling WHERE user_id = $1", unique_id)
         if level_user:
-            full_leaderboard = await self.bot.pool.fetch("SELECT * FROM main_site_leveling ORDER BY level DESC, xp DESC")
-            place = full_leaderboard.index(level_user) + 1
+            level_user = self.bot.xp_buffer.pending(member.id, level_user)
+            place = await self.bot.leaderboard.position(level_user['level'], level_user['xp'])
             em.add_field(name="Leveling:",
                          value=wrap(
                              f""">>> `Place:` {place}
@@ -1,42 +1,32 @@
-import asyncio
 import datetime
 import re
 from textwrap import dedent as wrap
 
-import asyncpg
 import discord
 import humanize
 from discord.ext import commands, flags
 
 from utils import checks
+from utils.mutes import MuteScheduler
 from utils.time import FutureTime
 
 
 class Mod(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self._task = bot.loop.create_task(self.dispatch_mutes())
+        self.mutes = MuteScheduler(bot, self.call_mute)
+        self._task = bot.loop.create_task(self.mutes.run())
 
-    async def dispatch_mutes(self):
-        try:
-            while not self.bot.is_closed():
-                seven_days = datetime.datetime.utcnow() + datetime.timedelta(days=7)
-                mutes = await self.bot.mod_pool.fetch("SELECT * FROM mutes WHERE expire < $1 ORDER BY expire", seven_days)
-                for mute in mutes:
-                    if mute['expire'] <= datetime.datetime.utcnow():
-                        await self.call_mute(mute)
-        except asyncio.CancelledError:
-            raise
-        except (OSError, discord.ConnectionClosed, asyncpg.PostgresConnectionError):
-            self._task.cancel()
-            self._task = self.bot.loop.create_task(self.dispatch_mutes())
+    def cog_unload(self):
+        self._task.cancel()
 
     async def call_mute(self, mute):
         member = self.bot.main_guild.get_member(mute["userid"])
         mute_role = self.bot.main_guild.get_role(725899725152190525)
         if member:
             await member.remove_roles(mute_role, reason="Unmuted")
-            await self.bot.mod_pool.execute("DELETE FROM mutes WHERE id = $1", mute["id"])
+        await self.bot.mod_pool.execute("DELETE FROM mutes WHERE id = $1", mute["id"])
+        if member:
             await self.do_case(self.bot.main_guild.get_member(mute["modid"]), member, "Automatic Un-mute", "Un-Mute")
 
     async def do_case(self, mod: discord.Member, member: discord.Member, reason, type, time=None):
@@ -80,14 +70,16 @@ class Mod(commands.Cog):
         if not ctx.author.top_role > member.top_role:
             return await ctx.send(f"You cannot kick someone higher than you!")
 
-        is_muted = await self.bot.mod_pool.fetch("SELECT * FROM mutes WHERE userid = $1", member.id)
         mute_role = self.bot.main_guild.get_role(725899725152190525)
-        if mute_role in member.roles or is_muted != []:
+        if mute_role in member.roles or await self.mutes.is_muted(member.id):
             return await ctx.send(f"This user is already muted!")
 
         await member.add_roles(mute_role, reason=reason)
         case_number = await self.do_case(ctx.author, member, reason, "Mute", time=length)
-        await self.bot.mod_pool.execute("INSERT INTO mutes VALUES($1, $2, $3, $4, $5)", ctx.author.id, member.id, datetime.datetime.utcnow(), length.dt, case_number)
+        mute = {"modid": ctx.author.id, "userid": member.id, "time": datetime.datetime.utcnow(),
+                "expire": length.dt, "id": case_number}
+        await self.bot.mod_pool.execute("INSERT INTO mutes VALUES($1, $2, $3, $4, $5)", *mute.values())
+        self.mutes.add(mute)
         send_time = humanize.naturaldelta(length.dt - datetime.datetime.utcnow())
         await ctx.send(f"**{member}** was successfully muted for {send_time}\nReason: *{reason}*")
 
@@ -97,12 +89,12 @@ class Mod(commands.Cog):
         if not ctx.author.top_role > member.top_role:
             return await ctx.send(f"You cannot un-mute someone higher than you!")
 
-        is_muted = await self.bot.mod_pool.fetch("SELECT * FROM mutes WHERE userid = $1", member.id)
         mute_role = self.bot.main_guild.get_role(725899725152190525)
-        if mute_role not in member.roles or is_muted == []:
+        if mute_role not in member.roles or not await self.mutes.is_muted(member.id):
             return await ctx.send(f"This user is not muted!")
 
         await self.bot.mod_pool.execute("DELETE FROM mutes WHERE userid = $1", member.id)
+        self.mutes.remove(member.id)
         await member.remove_roles(mute_role, reason=reason)
         await self.do_case(ctx.author, member, reason, "Un-Mute")
         await ctx.send(f"**{member}** was successfully unmuted.")
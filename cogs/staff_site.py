@@ -149,10 +149,13 @@ class Staff(commands.Cog):
 
         await self.bot.pool.execute("UPDATE main_site_user SET developer=True WHERE id=$1", bots["main_owner"])
         await self.bot.pool.execute("UPDATE main_site_bot SET approved=True WHERE id=$1", bot.id)
+        events=self.bot.get_cog("Events")
+        events.membership.approve(bot.id, bot.name, bots['uses_slash_commands'])
+        events.reminders.cancel(events.test_categories.get(bot.id))
         await self.bot.mod_pool.execute("UPDATE staff SET approved=approved + 1 WHERE userid=$1", ctx.author.id)
+        self.bot.counters.bump(queued=-1, approved=1)
 
-        queued_bots=await self.bot.pool.fetchval(
-            "SELECT COUNT(*) FROM main_site_bot WHERE approved=False AND denied=False")
+        queued_bots=(await self.bot.counters.get())['queued']
 
         invite_scopes = ("bot",)
         if bots['uses_slash_commands'] is True:
@@ -184,7 +187,7 @@ class Staff(commands.Cog):
             pass
 
         await bot.kick()
-        bots=await self.bot.pool.fetchval("SELECT COUNT(*) FROM main_site_bot")
+        bots=(await self.bot.counters.get())['bots']
         await self.bot.change_presence(activity=discord.Game(name=f"Watching {bots} bots"))
 
     @commands.has_permissions(kick_members=True)
@@ -250,6 +253,9 @@ class Staff(commands.Cog):
 
 
         await self.bot.pool.execute("UPDATE main_site_bot SET denied=True WHERE id=$1", bot.id)
+        events=self.bot.get_cog("Events")
+        events.reminders.cancel(events.test_categories.get(bot.id))
+        self.bot.counters.bump(queued=-1, denied=1)
         embed=discord.Embed(
             description=f"Denied {bot.name}", color=discord.Color.red())
         await ctx.send(embed=embed)
@@ -334,6 +340,9 @@ class Staff(commands.Cog):
         await self.bot.pool.execute("DELETE FROM main_site_auditlogaction WHERE bot_id=$1", bot_from_db['unique_id'])
         await self.bot.pool.execute("DELETE FROM main_site_announcement WHERE bot_id=$1", bot_from_db['unique_id'])
         await self.bot.pool.execute("DELETE FROM main_site_bot WHERE id=$1", bot_id)
+        self.bot.identities.invalidate("BOT", bot_id)
+        self.bot.counters.invalidate()
+        await self.bot.get_cog("Events").membership.remove(bot_id)
 
         await ctx.send(embed=discord.Embed(
             description=f"Deleted {bot_from_db['username']}", color=discord.Color.red()))
@@ -456,6 +465,7 @@ class Staff(commands.Cog):
                                                    reason=f"hold review for {reason}")
         await ctx.channel.category.set_permissions(ctx.author, reason=f"hold review for {reason}",
                                                    send_messages=True)
+        self.bot.get_cog("Events").reminders.cancel(ctx.channel.category.id)
 
         msg=await ctx.send(embed=em)
         await ctx.message.delete()
@@ -480,6 +490,10 @@ class Staff(commands.Cog):
                                                    reason="unlocked")
         await ctx.channel.category.set_permissions(ctx.guild.default_role, overwrite=everyone, reason="unlocked")
         await ctx.channel.category.set_permissions(ctx.author, overwrite=None, reason="unlocked")
+        events=self.bot.get_cog("Events")
+        bot_id=events.tested_bot(ctx.channel.category.id)
+        if bot_id is not None:
+            events.reminders.arm(ctx.channel.category, bot_id, restart=True)
 
         await ctx.send(embed=em)
         await ctx.message.delete()
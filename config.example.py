@@ -9,4 +9,5 @@ error_webhook_id = 0
 consumer_key = ""
 consumer_secret_key = ""
 access_token = ""
-access_token_secret = ""
\ No newline at end of file
+access_token_secret = ""
+fallback_fonts = ["NotoSans-Bold.ttf", "NotoSansCJK-Bold.ttc", "NotoSansSymbols2-Regular.ttf", "DejaVuSans-Bold.ttf"]
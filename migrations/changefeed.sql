@@ -0,0 +1,40 @@
+-- Change feed for the bot's caches, optional: without it the bot only sees its own writes.
+-- Install it on the site database with `python -m utils.changefeed install`.
+--
+-- Every row change on the tables below is sent on the blist_changes channel as
+-- {"table": ..., "op": "INSERT" | "UPDATE" | "DELETE", "key": ...}, the key column is the trigger's argument.
+-- Changes made by the bot itself are skipped, it already updates its caches when it writes.
+
+CREATE OR REPLACE FUNCTION blist_notify_change() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF current_setting('application_name') = 'blist-bot' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('blist_changes', json_build_object(
+        'table', TG_TABLE_NAME, 'op', TG_OP, 'key', row_data ->> TG_ARGV[0])::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS blist_changes ON main_site_bot;
+CREATE TRIGGER blist_changes AFTER INSERT OR UPDATE OR DELETE ON main_site_bot
+    FOR EACH ROW EXECUTE PROCEDURE blist_notify_change('id');
+
+DROP TRIGGER IF EXISTS blist_changes ON main_site_user;
+CREATE TRIGGER blist_changes AFTER INSERT OR UPDATE OR DELETE ON main_site_user
+    FOR EACH ROW EXECUTE PROCEDURE blist_notify_change('id');
+
+DROP TRIGGER IF EXISTS blist_changes ON main_site_leveling;
+CREATE TRIGGER blist_changes AFTER INSERT OR UPDATE OR DELETE ON main_site_leveling
+    FOR EACH ROW EXECUTE PROCEDURE blist_notify_change('user_id');
+
+DROP TRIGGER IF EXISTS blist_changes ON main_site_announcement;
+CREATE TRIGGER blist_changes AFTER INSERT OR UPDATE OR DELETE ON main_site_announcement
+    FOR EACH ROW EXECUTE PROCEDURE blist_notify_change('bot_id');
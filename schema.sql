@@ -24,4 +24,30 @@ CREATE TABLE IF NOT EXISTS staff (
     rank VARCHAR(25) NOT NULL DEFAULT '',
     DENIED BIGINT NOT NULL DEFAULT 0,
     strikes int NOT NULL DEFAULT 0
-);
\ No newline at end of file
+);
+
+-- the assignable roles menu is only added when the table is created, b!rr manages it after that.
+DO $$
+BEGIN
+    IF to_regclass('reaction_roles') IS NULL THEN
+        CREATE TABLE reaction_roles (
+            messageid BIGINT NOT NULL,
+            emoji VARCHAR(64) NOT NULL,
+            roleid BIGINT NOT NULL,
+            UNIQUE (messageid, emoji)
+        );
+
+        INSERT INTO reaction_roles (messageid, emoji, roleid) VALUES
+            (780106851961667614, '780103995879325696', 716723291011678319),
+            (780106851961667614, '🔞', 716723357336338482),
+            (780106851961667614, '780103641519358013', 779891942464421928),
+            (780106851961667614, '780103746432139274', 750771398636601354),
+            (780106851961667614, '780103872668237835', 716723257663029372);
+    END IF;
+END $$;
+
+-- approved bots that were reported for not being in the main guild, until they join.
+CREATE TABLE IF NOT EXISTS join_alerts (
+    botid BIGINT PRIMARY KEY,
+    alerted_at TIMESTAMP NOT NULL
+);
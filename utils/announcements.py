@@ -12,17 +12,10 @@ from markdownify import markdownify as md
     #return f"https://cdn.discordapp.com/avatars/{user_id}/{av_hash}.{av_format}?size=1024"
 
 async def is_bot_on_site(ctx, bot_id: int) -> bool:
-    check_bot = await ctx.bot.pool.fetchrow("SELECT * FROM main_site_bot WHERE id = $1", bot_id)
-    if not check_bot:
-        return False
-    return True
+    return await _get_unique_id(ctx, "BOT", bot_id) is not None
 
 async def _get_unique_id(ctx, table_type: str, bot_user_id: int) -> typing.Optional[int]:
-    queries = {
-        "BOT": "SELECT unique_id FROM main_site_bot WHERE id = $1",
-        "USER": "SELECT unique_id FROM main_site_user WHERE id = $1"
-    }
-    return await ctx.bot.pool.fetchval(queries[table_type], int(bot_user_id))
+    return await ctx.bot.identities.get(table_type, int(bot_user_id))
 
 
 async def _from_unique_id(ctx, table_type: str, unique_id: int) -> typing.Union[Bot, Author, None]:
@@ -0,0 +1,114 @@
+import asyncio
+import typing
+from collections import OrderedDict
+from io import BytesIO
+
+import discord
+from PIL import Image
+
+
+class AvatarFetcher:
+    """ Bounded LRU of decoded avatars, keyed by (user id, avatar hash, size).
+
+        Concurrent requests for the same avatar share one download. An avatar hash
+        changes whenever the user changes their avatar, so entries never go stale,
+        the ones of an old hash are dropped as soon as a new one is seen.
+        Animated avatars are kept as the gif itself, they're decoded where they're drawn.
+    """
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self.hits = self.misses = 0
+        self._avatars: OrderedDict = OrderedDict()  # key -> RGBA image
+        self._hashes: typing.Dict[int, typing.Optional[str]] = {}  # user id -> last seen avatar hash
+        self._pending: typing.Dict[tuple, asyncio.Future] = {}
+
+    def _forget_old_hash(self, user: discord.abc.User) -> None:
+        old_hash = self._hashes.get(user.id, user.avatar)
+        self._hashes[user.id] = user.avatar
+        if old_hash != user.avatar:
+            for key in [key for key in self._avatars if key[0] == user.id and key[1] == old_hash]:
+                del self._avatars[key]
+
+    async def _download(self, user: discord.abc.User, size: int) -> Image.Image:
+        data = await user.avatar_url_as(format="png", size=size).read()
+        with Image.open(BytesIO(data)) as avatar:
+            avatar = avatar.convert("RGBA")
+        if avatar.size != (size, size):
+            # default avatars ignore the size parameter.
+            avatar = avatar.resize((size, size))
+        return avatar
+
+    async def _download_gif(self, user: discord.abc.User, size: int) -> bytes:
+        return await user.avatar_url_as(format="gif", size=size).read()
+
+    async def _get(self, user: discord.abc.User, key: tuple, download: typing.Callable[[], typing.Awaitable]):
+        self._forget_old_hash(user)
+        avatar = self._avatars.get(key)
+        if avatar is not None:
+            self.hits += 1
+            self._avatars.move_to_end(key)
+            return avatar
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_event_loop().create_future()
+        self._pending[key] = future
+        try:
+            avatar = await download()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            # nobody might be waiting on it, don't let asyncio complain about it.
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+        future.set_result(avatar)
+        if self._hashes.get(user.id) == user.avatar:
+            self._avatars[key] = avatar
+            while len(self._avatars) > self.max_size:
+                (user_id, avatar_hash, *_), _ = self._avatars.popitem(last=False)
+                if self._hashes.get(user_id) == avatar_hash:
+                    del self._hashes[user_id]
+        return avatar
+
+    async def get(self, user: discord.abc.User, size: int = 128) -> Image.Image:
+        """ Returns the avatar of a user as a size x size RGBA image, the image must not be modified. """
+        return await self._get(user, (user.id, user.avatar, size), lambda: self._download(user, size))
+
+    async def get_animated(self, user: discord.abc.User, size: int = 128) -> bytes:
+        """ Returns the animated avatar of a user as gif, it's decoded by whoever draws it. """
+        return await self._get(user, (user.id, user.avatar, size, "gif"), lambda: self._download_gif(user, size))
+
+    async def get_many(self, users: typing.Iterable[typing.Optional[discord.abc.User]],
+                       size: int = 128) -> typing.List[typing.Optional[Image.Image]]:
+        """ Fetches the avatars of several users concurrently, in order.
+
+            None is returned for users that are None or whose avatar couldn't be downloaded,
+            one failed download doesn't fail the others.
+        """
+        async def get(user):
+            if user is None:
+                return None
+            try:
+                return await self.get(user, size)
+            except (discord.DiscordException, OSError):
+                return None
+
+        return await asyncio.gather(*[get(user) for user in users])
+
+    def stats(self) -> dict:
+        return {"avatars": len(self._avatars), "max_size": self.max_size, "downloading": len(self._pending),
+                "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        self._avatars.clear()
+        self._hashes.clear()
@@ -0,0 +1,197 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import time
+import typing
+from io import BytesIO
+
+import aiohttp
+from PIL import Image
+
+BACKGROUND_DIRECTORY = "cache/backgrounds"
+BACKGROUND_SIZE = (600, 150)
+# checked before anything is decoded
+MAX_BACKGROUND_BYTES = 8 * 1024 * 1024
+MAX_BACKGROUND_PIXELS = 32 * 1024 * 1024
+BACKGROUND_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+# seconds a background is safe from eviction after it was last used.
+EVICTION_GRACE = 60
+
+
+class BackgroundError(Exception):
+    """ Raised when a background can't be downloaded or isn't a usable image. """
+    pass
+
+
+class PreparedBackground(typing.NamedTuple):
+    """ A background stored by BackgroundCache, this is what the rank card workers get. """
+    path: str
+    brightness: float
+    digest: str
+
+
+def calculate_brightness(image):
+    greyscale_image = image.convert('L')
+    histogram = greyscale_image.histogram()
+    pixels = sum(histogram)
+    brightness = scale = len(histogram)
+
+    for index in range(0, scale):
+        ratio = histogram[index] / pixels
+        brightness += ratio * (-scale + index)
+
+    return 1 if brightness == 255 else brightness / scale
+
+
+def prepare_background(data: bytes) -> typing.Tuple[bytes, float]:
+    """ Decodes and resizes a background, returns it as png with its brightness.
+
+        The format and the dimensions are checked from the header before anything is decoded,
+        JPEGs are decoded at the smallest scale that's still larger than BACKGROUND_SIZE.
+    """
+    if len(data) > MAX_BACKGROUND_BYTES:
+        raise BackgroundError(f"that image is over {MAX_BACKGROUND_BYTES // 1024 // 1024} MiB")
+    try:
+        with Image.open(BytesIO(data)) as image:
+            if image.format not in BACKGROUND_FORMATS:
+                raise BackgroundError(f"{image.format or 'that'} images aren't supported, "
+                                      f"use one of {', '.join(sorted(BACKGROUND_FORMATS))}")
+            if image.width * image.height > MAX_BACKGROUND_PIXELS:
+                raise BackgroundError(f"that image is too big ({image.width}x{image.height})")
+            if image.format == "JPEG":
+                image.draft("RGB", BACKGROUND_SIZE)
+            image = image.convert("RGBA").resize(BACKGROUND_SIZE, reducing_gap=3.0)
+    except BackgroundError:
+        raise
+    except Image.DecompressionBombError:
+        raise BackgroundError("that image is too big")
+    except Exception as err:
+        raise BackgroundError(f"that doesn't look like an image ({err})")
+
+    buffer = BytesIO()
+    image.save(buffer, "png")
+    return buffer.getvalue(), calculate_brightness(image)
+
+
+class BackgroundCache:
+    """ Size-capped disk cache of custom rank card backgrounds, keyed by the hash of their url.
+
+        Backgrounds are stored pre-resized to 600x150 RGBA together with their brightness,
+        so rendering a card never downloads or decodes the original image. Backgrounds older
+        than `max_age` are revalidated with the ETag/Last-Modified of the response they came from.
+    """
+
+    def __init__(self, directory: str = BACKGROUND_DIRECTORY, max_bytes: int = 64 * 1024 * 1024,
+                 max_age: datetime.timedelta = datetime.timedelta(days=7)) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _paths(self, url: str) -> typing.Tuple[str, str]:
+        name = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.png"), os.path.join(self.directory, f"{name}.json")
+
+    def _read_meta(self, url: str) -> dict:
+        try:
+            with open(self._paths(url)[1], "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, url: str, meta: dict) -> None:
+        with open(self._paths(url)[1], "w") as file:
+            json.dump(meta, file)
+
+    def _prepared(self, url: str, meta: dict) -> PreparedBackground:
+        return PreparedBackground(self._paths(url)[0], meta['brightness'], meta['digest'])
+
+    def _evict(self) -> None:
+        """ Removes the least recently used backgrounds until the cache fits in max_bytes again.
+            Their metadata is kept, it's tiny.
+
+            Backgrounds used in the last EVICTION_GRACE seconds are kept even if that's over
+            max_bytes, a card that's about to be rendered may still need them.
+        """
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".png"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        recent = time.time() - EVICTION_GRACE
+        for used_at, size, path in sorted(files):
+            if total <= self.max_bytes or used_at > recent:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def _store(self, url: str, data: bytes, meta: dict) -> PreparedBackground:
+        png, brightness = prepare_background(data)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._paths(url)[0], "wb") as file:
+            file.write(png)
+        meta.update(url=url, brightness=brightness, digest=hashlib.sha1(png).hexdigest(), fetched_at=time.time())
+        self._write_meta(url, meta)
+        self._evict()
+        return self._prepared(url, meta)
+
+    async def _read(self, resp: aiohttp.ClientResponse) -> bytes:
+        """ Reads a response body, giving up as soon as it's over MAX_BACKGROUND_BYTES. """
+        if (resp.content_length or 0) > MAX_BACKGROUND_BYTES:
+            raise BackgroundError(f"that image is over {MAX_BACKGROUND_BYTES // 1024 // 1024} MiB")
+        data = bytearray()
+        async for chunk in resp.content.iter_chunked(64 * 1024):
+            data += chunk
+            if len(data) > MAX_BACKGROUND_BYTES:
+                raise BackgroundError(f"that image is over {MAX_BACKGROUND_BYTES // 1024 // 1024} MiB")
+        return bytes(data)
+
+    async def fetch(self, session: aiohttp.ClientSession, url: str, meta: dict = None) -> PreparedBackground:
+        """ Downloads, validates and stores a background. Sends a conditional request when `meta` is given.
+
+            Everything but the download runs in the default executor.
+        """
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            async with session.get(url, headers=headers) as resp:
+                if resp.status == 304 and meta:
+                    meta['fetched_at'] = time.time()
+                    self._write_meta(url, meta)
+                    return self._prepared(url, meta)
+                if resp.status != 200:
+                    raise BackgroundError(f"the url returned status {resp.status}")
+                data = await self._read(resp)
+                etag, last_modified = resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+        except aiohttp.ClientError as err:
+            raise BackgroundError(f"couldn't download that url ({err})")
+
+        return await asyncio.get_event_loop().run_in_executor(
+            None, self._store, url, data, {'etag': etag, 'last_modified': last_modified})
+
+    async def get(self, session: aiohttp.ClientSession, url: str) -> typing.Optional[PreparedBackground]:
+        """ Returns the stored background of a url, downloading it again if it was evicted.
+            Returns None if it can't be downloaded.
+        """
+        path, _ = self._paths(url)
+        meta = self._read_meta(url)
+        try:
+            if not os.path.exists(path) or not meta:
+                return await self.fetch(session, url)
+
+            os.utime(path)  # mark it as recently used
+            if time.time() - meta['fetched_at'] < self.max_age.total_seconds():
+                return self._prepared(url, meta)
+            return await self.fetch(session, url, meta)
+        except BackgroundError:
+            # a stale background is better than none.
+            return self._prepared(url, meta) if os.path.exists(path) and meta else None
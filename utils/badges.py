@@ -0,0 +1,68 @@
+import asyncio
+import os
+import typing
+
+import aiohttp
+from PIL import Image
+
+BADGE_DIRECTORY = "cache/badges"
+BADGE_SIZE = (28, 28)
+# only fetched once, when the file isn't in BADGE_DIRECTORY yet.
+BADGE_URLS = {
+    ("staff", "black"): "https://i.adiscorduser.com/FGHODzE.png",
+    ("developer", "black"): "https://i.adiscorduser.com/7JtOzav.png",
+    ("bug_hunter", "black"): "https://i.adiscorduser.com/gFPFm1g.png",
+    ("donator", "black"): "https://i.adiscorduser.com/4Is1fSC.png",
+    ("boosting", "black"): "https://i.adiscorduser.com/RmK5Twi.png",
+    ("staff", "white"): "https://i.adiscorduser.com/KUMkFE7.png",
+    ("developer", "white"): "https://i.adiscorduser.com/2TA4C8g.png",
+    ("bug_hunter", "white"): "https://i.adiscorduser.com/jClxGTJ.png",
+    ("donator", "white"): "https://i.adiscorduser.com/v5bEiYM.png",
+    ("boosting", "white"): "https://i.adiscorduser.com/RmK5Twi.png",
+}
+
+
+class BadgeStore:
+    """ Rank card badges, decoded and resized once for both the black and white variant. """
+
+    def __init__(self, directory: str = BADGE_DIRECTORY) -> None:
+        self.directory = directory
+        self.badges: typing.Dict[str, typing.Dict[str, Image.Image]] = {"black": {}, "white": {}}
+
+    @property
+    def count(self) -> int:
+        return sum(map(len, self.badges.values()))
+
+    def path(self, name: str, variant: str) -> str:
+        return os.path.join(self.directory, f"{name}_{variant}.png")
+
+    async def fetch_missing(self) -> None:
+        """ Downloads the badges that aren't stored locally yet. """
+        missing = {key: url for key, url in BADGE_URLS.items() if not os.path.exists(self.path(*key))}
+        if not missing:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        async with aiohttp.ClientSession() as session:
+            for (name, variant), url in missing.items():
+                try:
+                    async with session.get(url) as resp:
+                        if resp.status != 200:
+                            continue
+                        data = await resp.read()
+                except aiohttp.ClientError:
+                    continue
+                with open(self.path(name, variant), "wb") as file:
+                    file.write(data)
+
+    def load(self) -> None:
+        for name, variant in BADGE_URLS:
+            path = self.path(name, variant)
+            if not os.path.exists(path):
+                continue
+            with Image.open(path) as badge:
+                self.badges[variant][name] = badge.convert("RGBA").resize(BADGE_SIZE)
+
+    async def setup(self) -> None:
+        await self.fetch_missing()
+        await asyncio.get_event_loop().run_in_executor(None, self.load)
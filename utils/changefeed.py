@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import typing
+
+import asyncpg
+
+CHANNEL = "blist_changes"
+# the bot's connections to the site database go by this name, the triggers skip their writes.
+APPLICATION_NAME = "blist-bot"
+MIGRATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations", "changefeed.sql")
+UNINSTALL = """
+    DROP TRIGGER IF EXISTS blist_changes ON main_site_bot;
+    DROP TRIGGER IF EXISTS blist_changes ON main_site_user;
+    DROP TRIGGER IF EXISTS blist_changes ON main_site_leveling;
+    DROP TRIGGER IF EXISTS blist_changes ON main_site_announcement;
+    DROP FUNCTION IF EXISTS blist_notify_change();
+"""
+
+
+class Change(typing.NamedTuple):
+    table: str
+    op: str  # INSERT, UPDATE or DELETE
+    key: typing.Optional[int]
+
+    @classmethod
+    def parse(cls, payload: str) -> "Change":
+        data = json.loads(payload)
+        key = data.get('key')
+        return cls(data['table'], data['op'], int(key) if key is not None else None)
+
+
+Subscriber = typing.Callable[[Change], typing.Awaitable[None]]
+
+
+class ChangeFeed:
+    """ Row changes the site makes to its tables, see migrations/changefeed.sql.
+
+        A dedicated connection LISTENs on the channel the triggers notify and the changes are
+        handed to the subscribers of their table, in the order they were made. Notifications
+        sent while the connection is down are lost, so every reconnect calls the reset
+        subscribers, which drop everything they cached.
+    """
+
+    def __init__(self, dsn: str, keepalive: int = 60) -> None:
+        self.dsn = dsn
+        self.keepalive = keepalive
+        self.connected = False
+        self._subscribers: typing.Dict[str, typing.List[Subscriber]] = {}
+        self._reset_subscribers: typing.List[typing.Callable[[], typing.Awaitable[None]]] = []
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: typing.List[asyncio.Task] = []
+
+    def subscribe(self, table: str, callback: Subscriber) -> None:
+        self._subscribers.setdefault(table, []).append(callback)
+
+    def on_reset(self, callback: typing.Callable[[], typing.Awaitable[None]]) -> None:
+        self._reset_subscribers.append(callback)
+
+    def start(self) -> None:
+        if not self._tasks:
+            loop = asyncio.get_event_loop()
+            self._tasks = [loop.create_task(self._listen()), loop.create_task(self._dispatch())]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def _notified(self, connection, pid, channel, payload) -> None:
+        try:
+            change = Change.parse(payload)
+        except (ValueError, KeyError, TypeError):
+            print(f"Ignoring a malformed change notification: {payload!r}", file=sys.stderr)
+            return
+        self._queue.put_nowait(change)
+
+    async def _listen(self) -> None:
+        first = True
+        delay = 1
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn)
+            except Exception as error:
+                print(f"Change feed couldn't connect, retrying in {delay}s: {error}", file=sys.stderr)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+
+            try:
+                await connection.add_listener(CHANNEL, self._notified)
+                self.connected = True
+                delay = 1
+                if not first:
+                    # whatever changed while we weren't listening is unknown.
+                    self._queue.put_nowait(None)
+                first = False
+                while True:
+                    await asyncio.sleep(self.keepalive)
+                    await connection.fetchval("SELECT 1", timeout=10)
+            except Exception as error:
+                print(f"Change feed lost its connection: {error}", file=sys.stderr)
+            finally:
+                self.connected = False
+                connection.terminate()
+
+    async def _dispatch(self) -> None:
+        while True:
+            change = await self._queue.get()
+            callbacks = self._reset_subscribers if change is None else self._subscribers.get(change.table, [])
+            for callback in callbacks:
+                try:
+                    await (callback() if change is None else callback(change))
+                except Exception as error:
+                    print(f"Change feed subscriber failed on {change}: {error!r}", file=sys.stderr)
+
+
+async def _install(dsn: str) -> None:
+    connection = await asyncpg.connect(dsn)
+    try:
+        with open(MIGRATION, "r") as migration:
+            await connection.execute(migration.read())
+    finally:
+        await connection.close()
+
+
+async def _uninstall(dsn: str) -> None:
+    connection = await asyncpg.connect(dsn)
+    try:
+        await connection.execute(UNINSTALL)
+    finally:
+        await connection.close()
+
+
+async def _print_changes(dsn: str) -> None:
+    feed = ChangeFeed(dsn)
+
+    async def show(change: Change) -> None:
+        print(f"{change.table} {change.op} {change.key}")
+
+    async def reset() -> None:
+        print("reconnected, everything may have changed")
+
+    for table in ("main_site_bot", "main_site_user", "main_site_leveling", "main_site_announcement"):
+        feed.subscribe(table, show)
+    feed.on_reset(reset)
+    feed.start()
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m utils.changefeed",
+                                     description="Installs or watches the change feed of the site database.")
+    parser.add_argument("action", choices=("install", "uninstall", "listen"))
+    parser.add_argument("dsn", nargs="?", help="the site database, config.db_url by default")
+    args = parser.parse_args()
+
+    dsn = args.dsn
+    if dsn is None:
+        import config
+        dsn = config.db_url
+    actions = {"install": _install, "uninstall": _uninstall, "listen": _print_changes}
+    try:
+        asyncio.get_event_loop().run_until_complete(actions[args.action](dsn))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import asyncio
+import time
+import typing
+
+
+class SiteCounters:
+    """ Site wide counts, all computed by one query and served from memory for up to `max_age` seconds.
+
+        Approving and denying bots bump the counts they change so they stay exact in between,
+        anything that can't be followed that way (deleting a bot also deletes its votes) just
+        invalidates them.
+    """
+
+    query = """
+        SELECT COUNT(*) AS bots,
+               COUNT(*) FILTER (WHERE approved = True AND denied = False) AS approved,
+               COUNT(*) FILTER (WHERE approved = False AND denied = False) AS queued,
+               COUNT(*) FILTER (WHERE approved = False AND denied = True) AS denied,
+               COUNT(*) FILTER (WHERE certified = True) AS certified,
+               (SELECT COUNT(*) FROM main_site_user) AS users,
+               (SELECT COUNT(*) FROM main_site_vote) AS votes
+        FROM main_site_bot
+    """
+
+    def __init__(self, bot, max_age: int = 300) -> None:
+        self.bot = bot
+        self.max_age = max_age
+        self._counts: typing.Optional[typing.Dict[str, int]] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> typing.Dict[str, int]:
+        """ Returns bots, approved, queued, denied, certified, users and votes. """
+        if self._counts is not None and self._expires_at > time.monotonic():
+            return self._counts
+        async with self._lock:
+            # someone else may have refreshed them while we waited.
+            if self._counts is None or self._expires_at <= time.monotonic():
+                self._counts = dict(await self.bot.pool.fetchrow(self.query))
+                self._expires_at = time.monotonic() + self.max_age
+        return self._counts
+
+    def bump(self, **deltas: int) -> None:
+        """ Applies the change a write made, e.g. bump(queued=-1, approved=1) after an approval. """
+        if self._counts is not None:
+            for name, delta in deltas.items():
+                self._counts[name] += delta
+
+    def invalidate(self) -> None:
+        self._expires_at = 0.0
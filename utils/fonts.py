@@ -0,0 +1,126 @@
+import functools
+import unicodedata
+from typing import Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    from fontTools.ttLib import TTFont
+except ImportError:
+    TTFont = None
+
+try:
+    import config
+except ImportError:  # the benchmarks run without one
+    config = None
+
+# tried in order for the characters the card's own font doesn't have, the ones that aren't installed are skipped.
+# they don't come with the bot, install them on the host (fonts-noto, fonts-noto-cjk and fonts-dejavu on Debian).
+FALLBACK_FONTS = tuple(getattr(config, "fallback_fonts", (
+    "NotoSans-Bold.ttf", "NotoSansCJK-Bold.ttc", "NotoSansSymbols2-Regular.ttf", "DejaVuSans-Bold.ttf")))
+# combining marks, zero width joiners and variation selectors stay with the character before them.
+_ATTACHED = {"Mn", "Me", "Cf"}
+_PROBE_SIZE = 32
+
+
+@functools.lru_cache(maxsize=128)
+def get_font(face: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(face, size)
+
+
+class Coverage:
+    """ Bitmap of the codepoints a font has a glyph for.
+
+        With fontTools it's read from the font's cmap up front, without it every
+        codepoint is probed once by comparing it with the font's missing glyph box.
+    """
+
+    def __init__(self, face: str) -> None:
+        self.face = face
+        self.bits = bytearray(0x110000 >> 3)
+        self.known: Optional[bytearray] = None
+        font = get_font(face, _PROBE_SIZE)
+        if TTFont is not None:
+            try:
+                with TTFont(font.path, fontNumber=font.index, lazy=True) as ttf:
+                    for codepoint in ttf.getBestCmap():
+                        self.bits[codepoint >> 3] |= 1 << (codepoint & 7)
+                return
+            except Exception:
+                pass
+        self.known = bytearray(0x110000 >> 3)
+        self._missing = self._render("\U0010ffff")
+
+    def _render(self, character: str) -> bytes:
+        im = Image.new("L", (_PROBE_SIZE * 2, _PROBE_SIZE * 2))
+        ImageDraw.Draw(im).text((0, 0), character, font=get_font(self.face, _PROBE_SIZE), fill=255)
+        return im.tobytes()
+
+    def __contains__(self, codepoint: int) -> bool:
+        index, bit = codepoint >> 3, 1 << (codepoint & 7)
+        if self.known is not None and not self.known[index] & bit:
+            self.known[index] |= bit
+            if chr(codepoint).isspace() or self._render(chr(codepoint)) != self._missing:
+                self.bits[index] |= bit
+        return bool(self.bits[index] & bit)
+
+
+@functools.lru_cache(maxsize=None)
+def coverage(face: str) -> Optional[Coverage]:
+    """ Returns the coverage of a font, None if it isn't installed. """
+    try:
+        return Coverage(face)
+    except OSError:
+        return None
+
+
+def chain(face: str) -> Tuple[str, ...]:
+    """ `face` followed by the fallback fonts that are installed. """
+    return (face,) + tuple(fallback for fallback in FALLBACK_FONTS if fallback != face and coverage(fallback))
+
+
+@functools.lru_cache(maxsize=4096)
+def segment(face: str, text: str) -> Tuple[Tuple[str, str], ...]:
+    """ Splits text in runs of (text, face) drawn with the first font of the chain that has them.
+
+        Characters no font has stay with `face`, they'd be a box anyway.
+    """
+    faces = chain(face)
+    if len(faces) == 1:
+        return ((text, face),)
+    runs = []
+    for character in text:
+        if runs and unicodedata.category(character) in _ATTACHED:
+            runs[-1][0] += character
+            continue
+        codepoint = ord(character)
+        chosen = next((candidate for candidate in faces if codepoint in coverage(candidate)), face)
+        if runs and runs[-1][1] == chosen:
+            runs[-1][0] += character
+        else:
+            runs.append([character, chosen])
+    return tuple((run, run_face) for run, run_face in runs)
+
+
+@functools.lru_cache(maxsize=4096)
+def text_width(face: str, size: int, text: str) -> int:
+    runs = segment(face, text)
+    if len(runs) <= 1:
+        return get_font(face, size).getbbox(text)[2]
+    width = sum(get_font(run_face, size).getlength(run) for run, run_face in runs[:-1])
+    run, run_face = runs[-1]
+    return int(width + get_font(run_face, size).getbbox(run)[2])
+
+
+def draw_text(draw: ImageDraw.ImageDraw, xy: Tuple[int, int], text: str, face: str, size: int, fill) -> None:
+    """ Draws text with `face`, using the fallback fonts for the characters it doesn't have. """
+    runs = segment(face, text)
+    if len(runs) <= 1:
+        draw.text(xy, text, font=get_font(face, size), fill=fill)
+        return
+    # every run sits on the baseline of `face`.
+    x, baseline = xy[0], xy[1] + get_font(face, size).getmetrics()[0]
+    for run, run_face in runs:
+        font = get_font(run_face, size)
+        draw.text((x, baseline), run, font=font, fill=fill, anchor="ls", embedded_color=True)
+        x += font.getlength(run)
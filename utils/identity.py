@@ -0,0 +1,51 @@
+import time
+import typing
+from collections import OrderedDict
+
+
+class IdentityCache:
+    """ Bounded discord id -> unique_id cache for main_site_bot and main_site_user.
+
+        Ids that aren't on the site are cached too, but only for `negative_ttl` seconds
+        since they can sign up or get listed at any time.
+    """
+
+    queries = {
+        "BOT": "SELECT unique_id FROM main_site_bot WHERE id = $1",
+        "USER": "SELECT unique_id FROM main_site_user WHERE id = $1"
+    }
+
+    def __init__(self, bot, max_size: int = 10000, negative_ttl: int = 300) -> None:
+        self.bot = bot
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        # table type -> {discord id: (unique_id, expires_at or None)}
+        self._cache: typing.Dict[str, OrderedDict] = {table_type: OrderedDict() for table_type in self.queries}
+
+    def _store(self, table_type: str, discord_id: int, unique_id: typing.Optional[int]) -> None:
+        cache = self._cache[table_type]
+        expires_at = None if unique_id is not None else time.monotonic() + self.negative_ttl
+        cache[discord_id] = (unique_id, expires_at)
+        cache.move_to_end(discord_id)
+        while len(cache) > self.max_size:
+            cache.popitem(last=False)
+
+    async def get(self, table_type: str, discord_id: int) -> typing.Optional[int]:
+        """ Returns the unique_id of a bot or user, None if they aren't on the site. """
+        discord_id = int(discord_id)
+        cache = self._cache[table_type]
+        hit = cache.get(discord_id)
+        if hit is not None and (hit[1] is None or hit[1] > time.monotonic()):
+            cache.move_to_end(discord_id)
+            return hit[0]
+
+        unique_id = await self.bot.pool.fetchval(self.queries[table_type], discord_id)
+        self._store(table_type, discord_id, unique_id)
+        return unique_id
+
+    def invalidate(self, table_type: str, discord_id: int) -> None:
+        self._cache[table_type].pop(int(discord_id), None)
+
+    def clear(self) -> None:
+        for cache in self._cache.values():
+            cache.clear()
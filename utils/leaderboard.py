@@ -0,0 +1,200 @@
+import random
+import typing
+
+
+class _Node:
+
+    __slots__ = ("key", "priority", "size", "left", "right")
+
+    def __init__(self, key: tuple) -> None:
+        self.key = key
+        self.priority = random.random()
+        self.size = 1
+        self.left: typing.Optional[_Node] = None
+        self.right: typing.Optional[_Node] = None
+
+
+def _size(node: typing.Optional[_Node]) -> int:
+    return node.size if node else 0
+
+
+def _split(node: typing.Optional[_Node], key: tuple) -> typing.Tuple[typing.Optional[_Node], typing.Optional[_Node]]:
+    """ Splits a treap in keys lower than `key` and keys greater or equal to it. """
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        node.size = 1 + _size(node.left) + _size(node.right)
+        return node, right
+    left, node.left = _split(node.left, key)
+    node.size = 1 + _size(node.left) + _size(node.right)
+    return left, node
+
+
+def _merge(left: typing.Optional[_Node], right: typing.Optional[_Node]) -> typing.Optional[_Node]:
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.size = 1 + _size(left.left) + _size(left.right)
+        return left
+    right.left = _merge(left, right.left)
+    right.size = 1 + _size(right.left) + _size(right.right)
+    return right
+
+
+class LeaderboardIndex:
+    """ In-memory order-statistic index over main_site_leveling, ordered on level DESC, xp DESC.
+
+        Positions and ranges are answered in O(log n) once it's loaded,
+        before that positions fall back to a COUNT(*) query.
+
+        It also keeps snapshots of the rendered leaderboard, `generation` is bumped
+        whenever an XP write could change what one of them shows.
+    """
+
+    top_query = "SELECT u.id, u.username, u.discriminator, l.level, l.xp FROM main_site_leveling l " \
+                "JOIN main_site_user u ON u.unique_id = l.user_id ORDER BY l.level DESC, l.xp DESC"
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.loaded = False
+        self.generation = 0
+        self._root: typing.Optional[_Node] = None
+        self._keys: typing.Dict[int, tuple] = {}  # unique_id -> key
+        self._snapshots: typing.Dict[int, tuple] = {}  # limit -> (generation, rows)
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    @staticmethod
+    def _key(unique_id: int, level: int, xp: int) -> tuple:
+        return -level, -xp, unique_id
+
+    def _insert(self, key: tuple) -> None:
+        left, right = _split(self._root, key)
+        self._root = _merge(_merge(left, _Node(key)), right)
+
+    def _remove(self, key: tuple) -> None:
+        left, right = _split(self._root, key)
+        # `right` starts with the key itself.
+        _, right = _split(right, (key[0], key[1], key[2] + 1))
+        self._root = _merge(left, right)
+
+    async def load(self) -> None:
+        rows = await self.bot.pool.fetch("SELECT user_id, level, xp FROM main_site_leveling")
+        for row in rows:
+            # rows updated while we were fetching are newer than the database.
+            if row['user_id'] not in self._keys:
+                self.update(row['user_id'], row['level'], row['xp'])
+        self.loaded = True
+
+    async def reload(self) -> None:
+        """ Rebuilds the index from the database, for when it may have missed changes. """
+        before = dict(self._keys)
+        rows = await self.bot.pool.fetch("SELECT user_id, level, xp FROM main_site_leveling")
+        # rows updated while we were fetching are newer than the database.
+        changed = {unique_id: key for unique_id, key in self._keys.items() if before.get(unique_id) != key}
+        self._root, self._snapshots = None, {}
+        keys = {row['user_id']: self._key(row['user_id'], row['level'], row['xp']) for row in rows}
+        keys.update(changed)
+        for key in keys.values():
+            self._insert(key)
+        self._keys = keys
+        self.generation += 1
+        self.loaded = True
+
+    async def refresh(self, unique_id: int) -> None:
+        """ Reads the row of one user again. """
+        row = await self.bot.pool.fetchrow("SELECT level, xp FROM main_site_leveling WHERE user_id = $1", unique_id)
+        if row is None:
+            self.remove(unique_id)
+        else:
+            self.update(unique_id, row['level'], row['xp'])
+
+    def _touches_snapshots(self, key: typing.Optional[tuple]) -> bool:
+        if key is None or not self._snapshots:
+            return False
+        if not self.loaded:
+            return True
+        return self.rank_of(-key[0], -key[1]) <= max(self._snapshots)
+
+    def update(self, unique_id: int, level: int, xp: int) -> None:
+        key = self._key(unique_id, level, xp)
+        old_key = self._keys.get(unique_id)
+        if old_key == key:
+            return
+        stale = self._touches_snapshots(old_key)
+        if old_key is not None:
+            self._remove(old_key)
+        self._insert(key)
+        self._keys[unique_id] = key
+        if stale or self._touches_snapshots(key):
+            self.generation += 1
+
+    def remove(self, unique_id: int) -> None:
+        old_key = self._keys.pop(unique_id, None)
+        if old_key is not None:
+            self.generation += 1
+            self._remove(old_key)
+
+    def rank_of(self, level: int, xp: int) -> int:
+        """ 1-based position of a (level, xp) pair, users with the same level and xp share their position. """
+        key = (-level, -xp, float('-inf'))
+        node, lower = self._root, 0
+        while node is not None:
+            if node.key < key:
+                lower += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return lower + 1
+
+    def ranked(self, start: int = 0, count: typing.Optional[int] = None) -> typing.List[typing.Tuple[int, int, int]]:
+        """ Returns (unique_id, level, xp) of the users ranked start..start + count, 0-based. """
+        stop = len(self) if count is None else min(len(self), start + count)
+        stack, node, skipped = [], self._root, 0
+        # walk down to the node at `start`, keeping the ancestors that come after it.
+        while node is not None:
+            left_size = _size(node.left)
+            if start < skipped + left_size:
+                stack.append(node)
+                node = node.left
+            elif start == skipped + left_size:
+                stack.append(node)
+                break
+            else:
+                skipped += left_size + 1
+                node = node.right
+
+        result = []
+        while stack and len(result) < stop - start:
+            node = stack.pop()
+            result.append((node.key[2], -node.key[0], -node.key[1]))
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+        return result
+
+    async def position(self, level: int, xp: int) -> int:
+        if self.loaded:
+            return self.rank_of(level, xp)
+        return await self.bot.pool.fetchval(
+            "SELECT COUNT(*) FROM main_site_leveling WHERE (level, xp) > ($1, $2)", level, xp) + 1
+
+    async def top(self, limit: typing.Optional[int] = None) -> list:
+        """ Returns the id, username, discriminator, level and xp of the top `limit` users, None for everyone. """
+        snapshot = self._snapshots.get(limit)
+        if snapshot is not None and snapshot[0] == self.generation:
+            return snapshot[1]
+
+        generation = self.generation
+        # the snapshot is read from the database so it has to be up to date.
+        await self.bot.xp_buffer.flush()
+        if limit is None:
+            # not kept, every XP write would count as touching it and invalidate the others.
+            return await self.bot.pool.fetch(self.top_query)
+        rows = await self.bot.pool.fetch(self.top_query + " LIMIT $1", limit)
+        self._snapshots[limit] = (generation, rows)
+        return rows
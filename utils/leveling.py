@@ -0,0 +1,205 @@
+import datetime
+import time
+import typing
+
+import pytz
+
+utc = pytz.UTC
+
+
+def apply_xp(level: int, xp: int, gained: int) -> typing.Tuple[int, int]:
+    """ Returns the (level, xp) after gaining XP, a level up starts the next level at 0 XP. """
+    xp += gained
+    if xp >= level * 50:
+        return level + 1, 0
+    return level, xp
+
+
+class LevelEntry:
+
+    __slots__ = ("unique_id", "xp", "level", "delta", "last_time", "blacklisted", "stored", "loaded_at")
+
+    def __init__(self, data: dict) -> None:
+        self.delta = 0  # XP gained since the row was last written
+        self.last_time: typing.Optional[datetime.datetime] = None
+        self.rebase(data)
+
+    def rebase(self, data: dict) -> None:
+        """ Takes the values of a main_site_leveling row, the XP that wasn't written yet is kept. """
+        self.unique_id: int = data.get('unique_id', None)
+        # what's stored, `current` has the unwritten XP applied to it.
+        self.xp: int = data.get('xp', None) or 0
+        self.level: int = data.get('level', None) or 1
+        last_time = data.get('last_time', None)
+        if last_time and (self.last_time is None or last_time.replace(tzinfo=utc) > self.last_time):
+            self.last_time = last_time.replace(tzinfo=utc)
+        self.blacklisted: bool = bool(data.get('blacklisted', False))
+        # False until the user has a row in main_site_leveling.
+        self.stored: bool = data.get('user_id', None) is not None
+        if not self.stored:
+            self.delta = 0
+        self.loaded_at: typing.Optional[float] = time.monotonic()
+
+    def current(self) -> typing.Tuple[int, int]:
+        return apply_xp(self.level, self.xp, self.delta)
+
+
+class XPBuffer:
+    """ Write-behind store for the leveling system.
+
+        Messages only touch memory, the XP gained and the cooldowns are written back to
+        main_site_leveling with one statement per flush. The XP is added to whatever the row
+        has by then, so changes the site makes in the meantime aren't overwritten. Entries are
+        read again after `max_age` seconds to see site changes like blacklisting.
+    """
+
+    # the level up is worked out against the row, so a flush holds at most one: award() flushes right after one.
+    flush_query = """
+        UPDATE main_site_leveling AS l
+        SET xp = CASE WHEN l.xp + u.delta >= l.level * 50 THEN 0 ELSE l.xp + u.delta END,
+            level = CASE WHEN l.xp + u.delta >= l.level * 50 THEN l.level + 1 ELSE l.level END,
+            last_time = u.last_time
+        FROM unnest($1::bigint[], $2::int[], $3::timestamptz[]) AS u(user_id, delta, last_time)
+        WHERE l.user_id = u.user_id AND NOT l.blacklisted
+        RETURNING l.user_id, l.xp, l.level
+    """
+
+    def __init__(self, bot, cooldown: int = 60, max_age: int = 300) -> None:
+        self.bot = bot
+        self.cooldown = datetime.timedelta(seconds=cooldown)
+        self.max_age = max_age
+        self.entries: typing.Dict[int, LevelEntry] = {}  # discord id -> entry
+        self.dirty: typing.Set[int] = set()
+
+    async def get(self, member_id: int) -> typing.Optional[LevelEntry]:
+        """ Returns the cached leveling entry of a member, None if they aren't signed up. """
+        entry = self.entries.get(member_id)
+        if entry is not None and entry.loaded_at is not None and time.monotonic() - entry.loaded_at < self.max_age:
+            return entry
+
+        unique_id = await self.bot.identities.get("USER", member_id)
+        if unique_id is None:
+            self.entries.pop(member_id, None)
+            self.dirty.discard(member_id)
+            return None
+        row = await self.bot.pool.fetchrow(
+            "SELECT user_id, xp, level, last_time, blacklisted FROM main_site_leveling WHERE user_id = $1", unique_id)
+        data = dict(row) if row else {}
+        data['unique_id'] = unique_id
+        # another message may have loaded it while we were waiting.
+        entry = self.entries.get(member_id)
+        if entry is None:
+            return self.entries.setdefault(member_id, LevelEntry(data))
+        entry.rebase(data)
+        return entry
+
+    async def award(self, member_id: int, xp: int) -> typing.Optional[int]:
+        """ Gives a member XP if they're off cooldown, returns their new level if they levelled up. """
+        entry = await self.get(member_id)
+        if entry is None or entry.blacklisted:
+            return None
+
+        now = datetime.datetime.utcnow().replace(tzinfo=utc)
+        if entry.last_time is not None and entry.last_time > now:
+            return None
+        entry.last_time = now + self.cooldown
+
+        if not entry.stored:
+            entry.stored = True
+            entry.xp, entry.level = xp, 1
+            await self.bot.pool.execute(
+                "INSERT INTO main_site_leveling (xp, level, user_id, last_time, blacklisted, xp_bar_color, border_color, background_color) VALUES ($1, 1, $2, $3, False, $4, $5, $6)",
+                xp, entry.unique_id, entry.last_time, "", "", "")
+            self.bot.leaderboard.update(entry.unique_id, entry.level, entry.xp)
+            return None
+
+        old_level = entry.current()[0]
+        entry.delta += xp
+        self.dirty.add(member_id)
+        level, current_xp = entry.current()
+        self.bot.leaderboard.update(entry.unique_id, level, current_xp)
+        if level == old_level:
+            return None
+        # XP gained after a level up has to be added to the new level, not to the old one.
+        try:
+            await self.flush()
+        except Exception as error:
+            print(f"Couldn't write a level up, it's retried with the next flush: {error!r}")
+        return level
+
+    def pending(self, member_id: int, level_user) -> dict:
+        """ Returns a main_site_leveling row with the XP that hasn't been flushed yet applied to it. """
+        level_user = dict(level_user)
+        entry = self.entries.get(member_id)
+        if entry is not None and entry.stored and entry.delta:
+            level, xp = apply_xp(level_user['level'], level_user['xp'], entry.delta)
+            level_user.update(xp=xp, level=level)
+        return level_user
+
+    def forget(self, member_ids: typing.Iterable[int]) -> None:
+        """ Makes entries be read again on their next use, for when the site changed their rows.
+            The XP that wasn't written yet is kept and applied on top of the new row.
+        """
+        for member_id in member_ids:
+            entry = self.entries.get(member_id)
+            if entry is not None:
+                entry.loaded_at = None
+
+    async def reload_user(self, unique_id: int) -> None:
+        """ Reads a user's row again after the site changed it and updates the leaderboard with it. """
+        member_ids = [member_id for member_id, entry in self.entries.items() if entry.unique_id == unique_id]
+        if not member_ids:
+            await self.bot.leaderboard.refresh(unique_id)
+            return
+        for member_id in member_ids:
+            self.forget([member_id])
+            entry = await self.get(member_id)
+            if entry is not None and entry.stored:
+                self.bot.leaderboard.update(unique_id, *entry.current())
+            else:
+                self.bot.leaderboard.remove(unique_id)
+
+    def clear(self) -> None:
+        """ Makes every entry be read again on its next use. """
+        self.forget(list(self.entries))
+
+    def set_blacklisted(self, member_id: int, blacklisted: bool) -> None:
+        entry = self.entries.get(member_id)
+        if entry is not None:
+            entry.blacklisted = blacklisted
+
+    async def flush(self) -> int:
+        """ Writes every pending change in one statement, returns the amount of rows written. """
+        if not self.dirty:
+            return 0
+
+        dirty, self.dirty = self.dirty, set()
+        entries = [self.entries[member_id] for member_id in dirty if member_id in self.entries]
+        deltas = [entry.delta for entry in entries]
+        for entry in entries:
+            entry.delta = 0
+        try:
+            rows = await self.bot.pool.fetch(
+                self.flush_query,
+                [e.unique_id for e in entries], deltas, [e.last_time for e in entries])
+        except Exception:
+            # keep them around for the next flush.
+            for entry, delta in zip(entries, deltas):
+                entry.delta += delta
+            self.dirty |= dirty
+            raise
+
+        written = {row['user_id']: row for row in rows}
+        for member_id in dirty:
+            entry = self.entries.get(member_id)
+            if entry is None:
+                continue
+            row = written.get(entry.unique_id)
+            if row is None:
+                # blacklisted or deleted on the site, read it again when they're next seen.
+                del self.entries[member_id]
+                self.dirty.discard(member_id)
+                continue
+            entry.xp, entry.level = row['xp'], row['level']
+            self.bot.leaderboard.update(entry.unique_id, *entry.current())
+        return len(rows)
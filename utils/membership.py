@@ -0,0 +1,83 @@
+import datetime
+import typing
+
+import discord
+
+# approved bots that are never expected in the main guild.
+IGNORED_BOTS = {765175524594548737}
+
+
+class MembershipIndex:
+    """ Approved bots vs. the members of the main guild.
+
+        Kept current by the join/leave events and the approval flow, so nothing has to be
+        compared against the guild again. A bot is only reported once per time it goes
+        missing, the reported ones are stored in join_alerts so a restart doesn't report
+        them again.
+    """
+
+    def __init__(self, bot, grace: datetime.timedelta = datetime.timedelta(minutes = 30)) -> None:
+        self.bot = bot
+        self.grace = grace
+        self.approved: typing.Dict[int, typing.Tuple[str, bool]] = {}  # bot id -> (username, uses_slash_commands)
+        self.missing: typing.Dict[int, datetime.datetime] = {}  # bot id -> missing since
+        self.alerted: typing.Set[int] = set()
+
+    async def load(self) -> None:
+        rows = await self.bot.pool.fetch(
+            "SELECT id, username, uses_slash_commands FROM main_site_bot WHERE approved = True")
+        now = datetime.datetime.utcnow()
+        self.approved = {row['id']: (row['username'], row['uses_slash_commands'] is True) for row in rows}
+        self.missing = {bot_id: now for bot_id in self.approved
+                        if bot_id not in IGNORED_BOTS and self.bot.main_guild.get_member(bot_id) is None}
+        alerted = {row['botid'] for row in await self.bot.mod_pool.fetch("SELECT botid FROM join_alerts")}
+        # the ones that joined or were deleted while we were offline.
+        resolved = alerted.difference(self.missing)
+        if resolved:
+            await self.bot.mod_pool.execute("DELETE FROM join_alerts WHERE botid = ANY($1::bigint[])", list(resolved))
+        self.alerted = alerted.intersection(self.missing)
+
+    async def _resolve(self, bot_id: int) -> None:
+        if bot_id in self.alerted:
+            self.alerted.discard(bot_id)
+            await self.bot.mod_pool.execute("DELETE FROM join_alerts WHERE botid = $1", bot_id)
+
+    def approve(self, bot_id: int, username: str, uses_slash_commands: bool) -> None:
+        self.approved[bot_id] = (username, uses_slash_commands is True)
+        if bot_id not in IGNORED_BOTS and self.bot.main_guild.get_member(bot_id) is None:
+            self.missing.setdefault(bot_id, datetime.datetime.utcnow())
+
+    async def remove(self, bot_id: int) -> None:
+        """ The bot isn't listed anymore. """
+        self.approved.pop(bot_id, None)
+        self.missing.pop(bot_id, None)
+        await self._resolve(bot_id)
+
+    async def joined(self, member: discord.Member) -> None:
+        self.missing.pop(member.id, None)
+        await self._resolve(member.id)
+
+    def left(self, member: discord.Member) -> bool:
+        """ Returns whether the bot is approved. """
+        if member.id not in self.approved:
+            return False
+        if member.id not in IGNORED_BOTS:
+            self.missing.setdefault(member.id, datetime.datetime.utcnow())
+        return True
+
+    def pending_alerts(self) -> typing.List[typing.Tuple[int, str, bool]]:
+        """ (id, username, uses_slash_commands) of the bots missing for longer than the grace period
+            that weren't reported yet.
+        """
+        cutoff = datetime.datetime.utcnow() - self.grace
+        return [(bot_id, *self.approved[bot_id]) for bot_id, since in self.missing.items()
+                if since <= cutoff and bot_id not in self.alerted]
+
+    async def mark_alerted(self, bot_ids: typing.Iterable[int]) -> None:
+        bot_ids = [bot_id for bot_id in bot_ids if bot_id in self.missing and bot_id not in self.alerted]
+        if not bot_ids:
+            return
+        await self.bot.mod_pool.execute(
+            "INSERT INTO join_alerts (botid, alerted_at) SELECT unnest($1::bigint[]), $2 "
+            "ON CONFLICT (botid) DO NOTHING", bot_ids, datetime.datetime.utcnow())
+        self.alerted.update(bot_ids)
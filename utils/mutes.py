@@ -0,0 +1,87 @@
+import asyncio
+import datetime
+import heapq
+import typing
+
+
+class MuteScheduler:
+    """ The active mutes, in memory, with a timer for the one that expires first.
+
+        Mutes are kept in a min-heap on their expiry, the scheduler sleeps until the first
+        one is due and is woken up whenever a mute is added or removed. The mutes table is
+        only read at startup and after the expiry of a mute failed, a removed mute is just
+        skipped when it comes up in the heap.
+    """
+
+    def __init__(self, bot, on_expire: typing.Callable[[dict], typing.Awaitable[None]]) -> None:
+        self.bot = bot
+        self.on_expire = on_expire
+        self.loaded = False
+        self._mutes: typing.Dict[int, dict] = {}  # user id -> mute
+        self._heap: typing.List[typing.Tuple[datetime.datetime, int]] = []  # (expire, user id)
+        self._changed = asyncio.Event()
+
+    async def is_muted(self, user_id: int) -> bool:
+        if not self.loaded:
+            # the scheduler hasn't started yet, the table is all there is.
+            return await self.bot.mod_pool.fetchval("SELECT userid FROM mutes WHERE userid = $1", user_id) is not None
+        return user_id in self._mutes
+
+    def get(self, user_id: int) -> typing.Optional[dict]:
+        return self._mutes.get(user_id)
+
+    async def load(self) -> None:
+        rows = await self.bot.mod_pool.fetch("SELECT * FROM mutes")
+        self._mutes = {row['userid']: dict(row) for row in rows}
+        self._heap = [(mute['expire'], user_id) for user_id, mute in self._mutes.items()]
+        heapq.heapify(self._heap)
+        self.loaded = True
+        self._changed.set()
+
+    def add(self, mute: dict) -> None:
+        self._mutes[mute['userid']] = mute
+        heapq.heappush(self._heap, (mute['expire'], mute['userid']))
+        self._changed.set()
+
+    def remove(self, user_id: int) -> None:
+        if self._mutes.pop(user_id, None) is not None:
+            self._changed.set()
+
+    def _pop_due(self) -> typing.Tuple[typing.Optional[dict], typing.Optional[float]]:
+        """ Returns the first mute that's due, or how long until the next one is, None if there's none. """
+        while self._heap:
+            expire, user_id = self._heap[0]
+            mute = self._mutes.get(user_id)
+            if mute is None or mute['expire'] != expire:
+                # removed or replaced since it was scheduled.
+                heapq.heappop(self._heap)
+                continue
+            delay = (expire - datetime.datetime.utcnow()).total_seconds()
+            if delay > 0:
+                return None, delay
+            heapq.heappop(self._heap)
+            del self._mutes[user_id]
+            return mute, None
+        return None, None
+
+    async def run(self) -> None:
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            try:
+                if not self.loaded:
+                    await self.load()
+                mute, delay = self._pop_due()
+                if mute is not None:
+                    await self.on_expire(mute)
+                    continue
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                print(f"Couldn't expire mutes, reloading them: {error!r}")
+                self.loaded = False
+                await asyncio.sleep(10)
@@ -1,46 +1,338 @@
 import functools
+import hashlib
+import time
+from collections import OrderedDict
 from io import BytesIO
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 from .announcements import _get_unique_id
-import asyncio
-import discord
+from .backgrounds import PreparedBackground, calculate_brightness
+from .badges import BADGE_URLS, BadgeStore
+from . import fonts
+from .fonts import get_font, text_width
+from .render import RenderService
 from discord.ext.commands import Context
 from discord import Member
-from PIL import Image, ImageDraw, ImageFont, ImageOps
+from PIL import Image, ImageDraw, ImageOps, ImageSequence
 
-loop = asyncio.get_event_loop()
+USERNAME_FONT = "calibrib.ttf"
+POSITION_FONT = "calibri.ttf"
+# badge name -> the Rank attribute that enables it, in the order they are drawn.
+BADGE_FLAGS = {"boosting": "is_boosting", "staff": "is_staff", "developer": "developer",
+               "donator": "donator", "bug_hunter": "bug_hunter"}
+AVATAR_POSITION = (15, 15)
+AVATAR_SIZE = 128
+# animated cards take one render job, these keep it from taking the renderer over.
+MAX_GIF_FRAMES = 50
+MAX_GIF_BYTES = 4 * 1024 * 1024
+LEADERBOARD_ROW_HEIGHT = 74
+LEADERBOARD_AVATAR_SIZE = 64
+PLACE_COLORS = {1: (255, 215, 0, 255), 2: (192, 192, 192, 255), 3: (205, 127, 50, 255)}
 
-def async_executor():
-    def outer(func):
-        @functools.wraps(func)
-        def inner(*args, **kwargs):
-            thing = functools.partial(func, *args, **kwargs)
-            return loop.run_in_executor(None, thing)
+# badges of the process doing the drawing, the render workers load them in `warm_up`.
+_badges = BadgeStore()
+# how often a worker that's missing badges looks for them again, they're downloaded at startup.
+BADGE_RETRY_INTERVAL = 60
+_badges_loaded_at = 0.0
 
-        return inner
 
-    return outer
+def _load_badges(force: bool = False) -> None:
+    """ Loads the badges, again only once BADGE_RETRY_INTERVAL passed while some are still missing. """
+    global _badges_loaded_at
+    if not force and (_badges.count == len(BADGE_URLS)
+                      or time.monotonic() - _badges_loaded_at < BADGE_RETRY_INTERVAL):
+        return
+    count = _badges.count
+    _badges.load()
+    _badges_loaded_at = time.monotonic()
+    if _badges.count != count:
+        # the templates drawn so far are missing the new badges.
+        card_template.cache_clear()
 
-def calculate_brightness(image):
-    greyscale_image = image.convert('L')
-    histogram = greyscale_image.histogram()
-    pixels = sum(histogram)
-    brightness = scale = len(histogram)
 
-    for index in range(0, scale):
-        ratio = histogram[index] / pixels
-        brightness += ratio * (-scale + index)
+def warm_up() -> None:
+    """ Render worker initializer, loads the badges, the fonts every card uses and their coverage. """
+    _load_badges(force = True)
+    get_font(POSITION_FONT, 18)
+    get_font(USERNAME_FONT, 100)
+    for face in fonts.chain(USERNAME_FONT):
+        fonts.coverage(face)
+
+
+def fit_font_size(face: str, text: str, max_width: float, reference: int = 100) -> int:
+    """ Returns the largest font size at which `text` is still narrower than `max_width`. """
+    reference_width = text_width(face, reference, text)
+    if not reference_width:
+        return reference
+    # the width grows (almost) linearly with the size, so guess and correct it with a binary search.
+    guess = max(1, int(max_width * reference / reference_width))
+    low, high = max(1, guess - 2), guess + 2
+    while low > 1 and text_width(face, low, text) >= max_width:
+        low = max(1, low - 8)
+    while text_width(face, high, text) < max_width:
+        high += 8
+    while high - low > 1:
+        middle = (low + high) // 2
+        if text_width(face, middle, text) < max_width:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def load_background(background) -> Tuple[Image.Image, float]:
+    """ Returns the 600x150 background of a card and its brightness. """
+    if background:
+        if isinstance(background, PreparedBackground):  # url, already resized
+            with Image.open(background.path) as stored:
+                return stored.convert("RGBA"), background.brightness
+        im = Image.new('RGBA', (600, 150), background)  # rgb
+    else:
+        im = Image.new('RGBA', (600, 150), (44, 44, 44, 255))
+    return im, calculate_brightness(im)
+
+
+def paste_badges(im: Image.Image, text_color: str, badge_names: Tuple[str, ...]) -> None:
+    badge_x_pos, badge_y_pos = 385, 100
+    badge_variant = _badges.badges[text_color]
+    previous = False
+    for index, badge_name in enumerate(BADGE_FLAGS):
+        if badge_name not in badge_names:
+            previous = False
+            continue
+        # the first badge sits a bit further right when it's the boosting one.
+        badge_x_pos += 7 if index == 0 else 30 if previous else 8
+        previous = True
+        badge = badge_variant.get(badge_name)
+        if badge is not None:
+            im.paste(badge, (badge_x_pos, badge_y_pos), badge)
+
+
+@functools.lru_cache(maxsize=32)
+def card_template(background, border_color: str, badge_names: Tuple[str, ...]) -> Tuple[Image.Image, str]:
+    """ Returns the static layer of a rank card and the colour of its text.
+
+        That's the background, the border, the XP track and the badges, everything that
+        doesn't depend on the XP, level, position, name or avatar. The text colour follows
+        from the background so it's part of the key implicitly. Don't draw on the result, copy it.
+    """
+    im, brightness = load_background(background)
+    text_color = 'black' if brightness > 0.5 else 'white'
+    # border/outline
+    im = ImageOps.expand(im, border = 5, fill = border_color)
+    ImageDraw.Draw(im).rectangle((159, 105, 379, 130), fill=(64, 64, 64, 255))
+    paste_badges(im, text_color, badge_names)
+    return im, text_color
+
+
+def draw_details(im: Image.Image, text_color: str, name: str, xp: int, level: int, position: int,
+                 avatar: Optional[Image.Image], xp_bar_color: str) -> None:
+    """ Draws the text, the XP bar and the avatar on a copy of a template, avatar is None to leave it out. """
+    needed_xp = 50 + level * 50
+    img_fraction = 0.30
+    fontsize = fit_font_size(USERNAME_FONT, name, img_fraction * im.size[0])
+    im_draw = ImageDraw.Draw(im)
+    pos_font = get_font(POSITION_FONT, fontsize)
+    xp_level_font = get_font(POSITION_FONT, 18)
+    fonts.draw_text(im_draw, (159, 15), name, USERNAME_FONT, fontsize, text_color)
+    im_draw.text((343, 15), f"| #{position}", font=pos_font, fill=text_color)
+    im_draw.text((159, 85), f"{xp} / {needed_xp}", font=xp_level_font, fill=text_color)
+    im_draw.text((311, 85), f"Level: {level}", font=xp_level_font, fill=text_color)
+
+    im_draw.rectangle((159, 105, 179 + (int(int(xp)/needed_xp * 100)) * 2, 130), fill=xp_bar_color)
+
+    if avatar is not None:
+        im.paste(avatar, AVATAR_POSITION, avatar)
+
+
+def encode_png(im: Image.Image) -> bytes:
+    buffer = BytesIO()
+    im.save(buffer, 'png')
+    return buffer.getvalue()
+
+
+def draw_card(name: str, xp: int, level: int, position: int, avatar: Image.Image, badge_flags: dict,
+              border_color: str, xp_color: Optional[str], background) -> bytes:
+    """ Draws a rank card and returns it as png, runs in the render workers.
+
+        background is a colour, a PreparedBackground or None for the default one.
+        Only the text, the XP bar and the avatar are drawn here, the rest comes from `card_template`.
+    """
+    # they might've been downloaded after this worker started.
+    _load_badges()
+
+    badge_names = tuple(badge for badge, flag in BADGE_FLAGS.items() if badge_flags[flag])
+    template, text_color = card_template(background, border_color, badge_names)
+    im = template.copy()
+    draw_details(im, text_color, name, xp, level, position, avatar, xp_color or text_color)
+    return encode_png(im)
+
+
+def read_frames(data: bytes, max_frames: int = MAX_GIF_FRAMES) -> Tuple[List[Image.Image], List[int]]:
+    """ Decodes an animated avatar into RGBA frames and their durations in ms.
+
+        Longer animations are sampled evenly down to `max_frames`, a sampled frame
+        stays up for the frames that were skipped so the animation keeps its speed.
+    """
+    frames, durations = [], []
+    with Image.open(BytesIO(data)) as gif:
+        step = -(-getattr(gif, "n_frames", 1) // max_frames)
+        for index, frame in enumerate(ImageSequence.Iterator(gif)):
+            duration = max(20, frame.info.get("duration", 100))
+            if index % step:
+                durations[-1] += duration
+                continue
+            frame = frame.convert("RGBA")
+            if frame.size != (AVATAR_SIZE, AVATAR_SIZE):
+                frame = frame.resize((AVATAR_SIZE, AVATAR_SIZE))
+            frames.append(frame)
+            durations.append(duration)
+    return frames, durations
+
+
+def draw_animated_card(name: str, xp: int, level: int, position: int, avatar_gif: bytes, badge_flags: dict,
+                       border_color: str, xp_color: Optional[str], background) -> bytes:
+    """ Draws a rank card with an animated avatar and returns it as gif, runs in the render workers.
+
+        Everything but the avatar is drawn and quantized once, each frame only quantizes the
+        avatar region with the same palette and pastes it on a copy of that.
+        Falls back to a png of the first frame when the gif would be over MAX_GIF_BYTES.
+    """
+    _load_badges()
+
+    frames, durations = read_frames(avatar_gif)
+    badge_names = tuple(badge for badge, flag in BADGE_FLAGS.items() if badge_flags[flag])
+    template, text_color = card_template(background, border_color, badge_names)
+    im = template.copy()
+    draw_details(im, text_color, name, xp, level, position, None, xp_color or text_color)
+    if len(frames) == 1:
+        im.paste(frames[0], AVATAR_POSITION, frames[0])
+        return encode_png(im)
+
+    # build the palette from the card and a few frames, so the avatar's colours are in it too.
+    samples = frames[::max(1, len(frames) // 4)][:4]
+    source = Image.new('RGB', (max(im.width, AVATAR_SIZE * len(samples)), im.height + AVATAR_SIZE))
+    source.paste(im.convert('RGB'), (0, 0))
+    for index, frame in enumerate(samples):
+        source.paste(frame, (index * AVATAR_SIZE, im.height), frame)
+    palette = source.quantize(256)
+    static = im.convert('RGB').quantize(palette=palette, dither=Image.NONE)
+
+    box = AVATAR_POSITION + (AVATAR_POSITION[0] + AVATAR_SIZE, AVATAR_POSITION[1] + AVATAR_SIZE)
+    behind_avatar = im.crop(box)
+    output = []
+    for frame in frames:
+        region = behind_avatar.copy()
+        region.paste(frame, (0, 0), frame)
+        card = static.copy()
+        card.paste(region.convert('RGB').quantize(palette=palette, dither=Image.NONE), box)
+        output.append(card)
+
+    buffer = BytesIO()
+    # optimize would build a new palette per frame, the shared one is the point.
+    output[0].save(buffer, 'gif', save_all=True, append_images=output[1:], duration=durations,
+                   loop=0, optimize=False)
+    if buffer.tell() > MAX_GIF_BYTES:
+        im.paste(frames[0], AVATAR_POSITION, frames[0])
+        return encode_png(im)
+    return buffer.getvalue()
+
+
+def draw_leaderboard(rows: list) -> bytes:
+    """ Draws the leaderboard as one image and returns it as png, runs in the render workers.
+
+        rows are (place, name, level, xp, avatar or None, badge names), the fonts and badges
+        are shared by every row.
+    """
+    _load_badges()
+    width, border = 600, 5
+    im = Image.new('RGBA', (width, LEADERBOARD_ROW_HEIGHT * len(rows)), (44, 44, 44, 255))
+    im = ImageOps.expand(im, border = border, fill = (114, 137, 218, 255))
+    im_draw = ImageDraw.Draw(im)
+    place_font = get_font(USERNAME_FONT, 26)
+    detail_font = get_font(POSITION_FONT, 18)
+    badge_variant = _badges.badges['white']
+
+    for index, (place, name, level, xp, avatar, badge_names) in enumerate(rows):
+        top = border + index * LEADERBOARD_ROW_HEIGHT
+        if index:
+            im_draw.line((border, top, border + width, top), fill=(64, 64, 64, 255), width=1)
+        avatar_top = top + (LEADERBOARD_ROW_HEIGHT - LEADERBOARD_AVATAR_SIZE) // 2
+        if avatar is not None:
+            im.paste(avatar, (15, avatar_top), avatar)
+        else:
+            im_draw.rectangle((15, avatar_top, 15 + LEADERBOARD_AVATAR_SIZE, avatar_top + LEADERBOARD_AVATAR_SIZE),
+                              fill=(64, 64, 64, 255))
+
+        im_draw.text((92, top + 10), f"#{place}", font=place_font, fill=PLACE_COLORS.get(place, 'white'))
+        name_size = min(26, fit_font_size(USERNAME_FONT, name, 260))
+        fonts.draw_text(im_draw, (160, top + 10), name, USERNAME_FONT, name_size, 'white')
+
+        needed_xp = 50 + level * 50
+        im_draw.text((160, top + 44), f"Level: {level}", font=detail_font, fill='white')
+        im_draw.text((260, top + 44), f"{xp} / {needed_xp}", font=detail_font, fill='white')
+        im_draw.rectangle((380, top + 46, 580, top + 62), fill=(64, 64, 64, 255))
+        im_draw.rectangle((380, top + 46, 380 + int(min(xp, needed_xp) / needed_xp * 200), top + 62), fill='white')
+
+        badge_x_pos = 580 - 28
+        for badge_name in reversed(badge_names):
+            badge = badge_variant.get(badge_name)
+            if badge is not None:
+                im.paste(badge, (badge_x_pos, top + 10), badge)
+                badge_x_pos -= 30
+
+    return encode_png(im)
+
+
+class CardCache:
+    """ LRU of rendered rank cards, bounded by the total size of the stored PNGs.
+
+        Keys are digests of everything that ends up on the card, see `Rank.cache_key`.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self._cards: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.blake2b(repr(parts).encode(), digest_size=20).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        card = self._cards.get(key)
+        if card is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._cards.move_to_end(key)
+        return card
+
+    def put(self, key: str, card: bytes) -> None:
+        if len(card) > self.max_bytes:
+            return
+        old = self._cards.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._cards[key] = card
+        self.size += len(card)
+        while self.size > self.max_bytes:
+            _, evicted = self._cards.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {"cards": len(self._cards), "bytes": self.size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+card_cache = CardCache()
 
-    return 1 if brightness == 255 else brightness / scale
 
 class Rank:
     def __init__(self, ctx: Context, member: Member, **kwargs) -> None:
         ctx = ctx
-        self.username_font_name = "calibrib.ttf"
-        self.position_font_name = "calibri.ttf"
-        self.user_font = ImageFont.truetype("calibrib.ttf", 21)
-        self.xp_level_font = ImageFont.truetype("calibri.ttf", 18)
         self.bug_hunter = kwargs.get("bug_hunter", False)
         self.developer = kwargs.get("developer", False)
         self.is_staff = kwargs.get("is_staff", False)
@@ -49,95 +341,42 @@ class Rank:
         self.ctx = ctx
         self.user = member
 
-    @async_executor()
-    def get_card(self, xp: int, level: int, position: int, avatar_bytes,
-                 badges_black: dict, badges_white: dict, custom: dict) -> BytesIO:
-        avatar = Image.open(avatar_bytes).convert("RGBA")
-        needed_xp = 50 + level * 50
+    @property
+    def badge_flags(self) -> dict:
+        return {"is_boosting": self.is_boosting, "is_staff": self.is_staff, "developer": self.developer,
+                "donator": self.donator, "bug_hunter": self.bug_hunter}
 
-        border_color = str(self.user.color)
-        if custom.get('border_color', None):
-            border_color = custom['border_color']
-        if custom.get('xp_color', None):
-            xp_bar_color = custom['xp_color']
-        else:
-            xp_bar_color = "text"
-        if custom.get('background', None):
-            bg = custom['background']
-            if isinstance(bg, BytesIO):  # url
-                im = Image.open(bg).convert("RGBA")
-                im = im.resize((600, 150))
-            else:  # rgb
-                im = Image.new('RGBA', (600, 150), bg)
-        else:
-            im = Image.new('RGBA', (600, 150), (44, 44, 44, 255))
-
-        text_color = 'black' if calculate_brightness(im) > 0.5 else 'white'
-        xp_bar_color = text_color if xp_bar_color == "text" else xp_bar_color
-        # border/outline
-        im = ImageOps.expand(im, border = 5, fill = border_color)
-
-        fontsize = 1
-        img_fraction = 0.30
-
-        font = ImageFont.truetype(self.username_font_name, fontsize)
-        while font.getsize(str(self.user))[0] < img_fraction * im.size[0]:
-            # iterate until the text size is just larger than the criteria
-            fontsize += 1
-            font = ImageFont.truetype(self.username_font_name, fontsize)
-
-        fontsize -= 1
-        font = ImageFont.truetype(self.username_font_name, fontsize)
-        im_draw = ImageDraw.Draw(im)
-        pos_font = ImageFont.truetype(self.position_font_name, fontsize)
-        im_draw.text((159, 15), str(self.user), font=font, fill=text_color)
-        im_draw.text((343, 15), f"| #{position}", font=pos_font, fill=text_color)
-        im_draw.text((159, 85), f"{xp} / {needed_xp}", font=self.xp_level_font, fill=text_color)
-        im_draw.text((311, 85), f"Level: {level}", font=self.xp_level_font, fill=text_color)
-
-        im_draw.rectangle((159, 105, 379, 130), fill=(64, 64, 64, 255))
-        im_draw.rectangle((159, 105, 179 + (int(int(xp)/needed_xp * 100)) * 2, 130), fill=xp_bar_color)
-
-        im.paste(avatar, (15, 15), avatar)
-
-        badge_x_pos, badge_y_pos = 385, 100
-        badge_size = (28, 28)
-        if self.is_boosting:
-            badge_x_pos += 7
-            badges = badges_black if text_color == 'black' else badges_white
-            donator_badge = Image.open(badges['boosting']).convert("RGBA")
-            donator_badge = donator_badge.resize(badge_size)
-            im.paste(donator_badge, (badge_x_pos, badge_y_pos), donator_badge)
-        if self.is_staff:
-            badge_x_pos += 30 if self.is_boosting else 8
-            badges = badges_black if text_color == 'black' else badges_white
-            staff_badge = Image.open(badges['staff']).convert("RGBA")
-            staff_badge = staff_badge.resize(badge_size)
-            im.paste(staff_badge, (badge_x_pos, badge_y_pos), staff_badge)
-        if self.developer:
-            badge_x_pos += 30 if self.is_staff else 8
-            badges = badges_black if text_color == 'black' else badges_white
-            dev_badge = Image.open(badges['developer']).convert("RGBA")
-            dev_badge = dev_badge.resize(badge_size)
-            im.paste(dev_badge, (badge_x_pos, badge_y_pos), dev_badge)
-        if self.donator:
-            badge_x_pos += 30 if self.developer else 8
-            badges = badges_black if text_color == 'black' else badges_white
-            donator_badge = Image.open(badges['donator']).convert("RGBA")
-            donator_badge = donator_badge.resize(badge_size)
-            im.paste(donator_badge, (badge_x_pos, badge_y_pos), donator_badge)
-        if self.bug_hunter:
-            badge_x_pos += 30 if self.donator else 8
-            badges = badges_black if text_color == 'black' else badges_white
-            bug_hunter_badge = Image.open(badges['bug_hunter']).convert("RGBA")
-            bug_hunter_badge = bug_hunter_badge.resize(badge_size)
-            im.paste(bug_hunter_badge, (badge_x_pos, badge_y_pos), bug_hunter_badge)
-
-        buffer = BytesIO()
-        im.save(buffer, 'png')
-        buffer.seek(0)
-
-        return buffer
+    def cache_key(self, xp: int, level: int, position: int, badges: BadgeStore, custom: dict,
+                  animated: bool = False) -> str:
+        return card_cache.key(
+            xp, level, position, self.user.avatar, str(self.user), animated,
+            self.bug_hunter, self.developer, self.is_staff, self.donator, self.is_boosting,
+            custom.get('border_color', None) or str(self.user.color), custom.get('xp_color', None),
+            # PreparedBackground includes the digest of the stored image.
+            str(custom.get('background', None)),
+            # cards rendered before the badges were loaded are missing them.
+            badges.count)
+
+    async def get_card(self, xp: int, level: int, position: int, badges: BadgeStore, custom: dict,
+                       renderer: RenderService, animated: bool = False) -> Tuple[BytesIO, str]:
+        """ Returns the rank card and its file name, identical cards are served from `card_cache`.
+
+            With `animated` the card is a gif of the user's animated avatar, unless it'd be too big.
+            Raises RendererBusy when the renderer has too much queued already.
+        """
+        key = self.cache_key(xp, level, position, badges, custom, animated)
+        card = card_cache.get(key)
+        if card is None:
+            if animated:
+                avatar, draw = await self.ctx.bot.avatars.get_animated(self.user, AVATAR_SIZE), draw_animated_card
+            else:
+                avatar, draw = await self.ctx.bot.avatars.get(self.user, AVATAR_SIZE), draw_card
+            card = await renderer.submit(
+                draw, str(self.user), xp, level, position, avatar, self.badge_flags,
+                custom.get('border_color', None) or str(self.user.color), custom.get('xp_color', None),
+                custom.get('background', None))
+            card_cache.put(key, card)
+        return BytesIO(card), 'rank_card.gif' if card[:4] == b'GIF8' else 'rank_card.png'
 
     async def customize_rank_card(self, update_type: str, new_value: str = None) -> Tuple[bool, str]:
         queries = {
@@ -153,3 +392,26 @@ class Rank:
             return True, str(new_value)
         except Exception as err:
             return False, str(err)
+
+
+async def get_leaderboard(bot, leaders: list, badges: BadgeStore, renderer: RenderService) -> BytesIO:
+    """ Returns the leaderboard image, drawn by one render job.
+
+        leaders are (place, user or None, name, level, xp, badge names),
+        the avatars of every user are fetched concurrently.
+        Raises RendererBusy when the renderer has too much queued already.
+    """
+    key = card_cache.key(
+        "leaderboard", [(place, getattr(user, 'avatar', None), name, level, xp, badge_names)
+                        for place, user, name, level, xp, badge_names in leaders],
+        badges.count)
+    image = card_cache.get(key)
+    if image is not None:
+        return BytesIO(image)
+
+    avatars = await bot.avatars.get_many([leader[1] for leader in leaders], LEADERBOARD_AVATAR_SIZE)
+    rows = [(place, name, level, xp, avatar, badge_names)
+            for (place, _, name, level, xp, badge_names), avatar in zip(leaders, avatars)]
+    image = await renderer.submit(draw_leaderboard, rows)
+    card_cache.put(key, image)
+    return BytesIO(image)
@@ -0,0 +1,80 @@
+import asyncio
+import typing
+
+import discord
+
+
+def emoji_key(emoji: typing.Union[discord.PartialEmoji, str]) -> str:
+    """ Custom emojis are stored by id, unicode ones as themselves. """
+    if isinstance(emoji, str):
+        return emoji
+    return str(emoji.id) if emoji.id else emoji.name
+
+
+class ReactionRoles:
+    """ (message id, emoji) -> Role index over the reaction_roles table of the main guild.
+
+        Reactions only queue the role a member should or shouldn't have, the roles are
+        edited `delay` seconds after their last reaction, so someone toggling a reaction
+        a few times in a row costs at most one call to add roles and one to remove them.
+    """
+
+    def __init__(self, bot, delay: float = 2.0) -> None:
+        self.bot = bot
+        self.delay = delay
+        self.roles: typing.Dict[typing.Tuple[int, str], discord.Role] = {}
+        # member id -> {role: whether they should have it}
+        self._pending: typing.Dict[int, typing.Dict[discord.Role, bool]] = {}
+        self._tasks: typing.Dict[int, asyncio.Task] = {}
+
+    async def load(self) -> None:
+        rows = await self.bot.mod_pool.fetch("SELECT messageid, emoji, roleid FROM reaction_roles")
+        roles = {}
+        for row in rows:
+            role = self.bot.main_guild.get_role(row['roleid'])
+            if role is not None:
+                roles[(row['messageid'], row['emoji'])] = role
+        self.roles = roles
+
+    def get(self, message_id: int, emoji: typing.Union[discord.PartialEmoji, str]) -> typing.Optional[discord.Role]:
+        return self.roles.get((message_id, emoji_key(emoji)))
+
+    async def add(self, message_id: int, emoji: typing.Union[discord.PartialEmoji, str], role: discord.Role) -> None:
+        await self.bot.mod_pool.execute(
+            "INSERT INTO reaction_roles (messageid, emoji, roleid) VALUES ($1, $2, $3) "
+            "ON CONFLICT (messageid, emoji) DO UPDATE SET roleid = EXCLUDED.roleid",
+            message_id, emoji_key(emoji), role.id)
+        self.roles[(message_id, emoji_key(emoji))] = role
+
+    async def remove(self, message_id: int, emoji: typing.Union[discord.PartialEmoji, str]) -> bool:
+        result = await self.bot.mod_pool.execute("DELETE FROM reaction_roles WHERE messageid = $1 AND emoji = $2",
+                                                 message_id, emoji_key(emoji))
+        self.roles.pop((message_id, emoji_key(emoji)), None)
+        return result != "DELETE 0"
+
+    def queue(self, member_id: int, role: discord.Role, wanted: bool) -> None:
+        self._pending.setdefault(member_id, {})[role] = wanted
+        task = self._tasks.get(member_id)
+        if task is not None:
+            task.cancel()
+        self._tasks[member_id] = self.bot.loop.create_task(self._apply(member_id))
+
+    async def _apply(self, member_id: int) -> None:
+        await asyncio.sleep(self.delay)
+        del self._tasks[member_id]
+        changes = self._pending.pop(member_id, {})
+        member = self.bot.main_guild.get_member(member_id)
+        if member is None:
+            return
+
+        roles = set(member.roles)
+        to_add = [role for role, wanted in changes.items() if wanted and role not in roles]
+        to_remove = [role for role, wanted in changes.items() if not wanted and role in roles]
+        # only the menu's roles are touched, anything else may have changed in the meantime.
+        try:
+            if to_add:
+                await member.add_roles(*to_add, reason="Assignable Roles")
+            if to_remove:
+                await member.remove_roles(*to_remove, reason="Assignable Roles")
+        except discord.HTTPException:
+            pass
@@ -0,0 +1,90 @@
+import asyncio
+import collections
+import functools
+import time
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class RendererBusy(Exception):
+    """ Raised when too many images are already waiting to be rendered. """
+    pass
+
+
+def _noop() -> None:
+    return None
+
+
+class RenderService:
+    """ Renders images in a small process pool, so Pillow doesn't hold the GIL the gateway needs.
+
+        At most `max_pending` jobs can be running or waiting at once, anything past
+        that is rejected with RendererBusy instead of piling up.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 8,
+                 initializer: typing.Optional[typing.Callable[[], None]] = None) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.initializer = initializer
+        self.pending = 0
+        self.rendered = 0
+        self.rejected = 0
+        self.failed = 0
+        self.latencies: typing.Deque[float] = collections.deque(maxlen=500)
+        self._executor: typing.Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+        return self._executor
+
+    async def start(self) -> None:
+        """ Starts every worker now, so the first renders don't pay for their warm up. """
+        loop = asyncio.get_event_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _noop) for _ in range(self.workers)])
+
+    async def submit(self, func: typing.Callable, *args, **kwargs):
+        """ Runs `func` in a worker, `func` and its arguments have to be picklable. """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise RendererBusy(f"{self.pending} renders are already queued")
+
+        self.pending += 1
+        started = time.perf_counter()
+        executor = self.executor
+        try:
+            result = await asyncio.get_event_loop().run_in_executor(
+                executor, functools.partial(func, *args, **kwargs))
+        except BrokenProcessPool:
+            # a worker died, the pool can't be used anymore. The next render starts a new one.
+            self.failed += 1
+            if self._executor is executor:
+                self.shutdown()
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.rendered += 1
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+        return {"workers": self.workers, "pending": self.pending, "max_pending": self.max_pending,
+                "queued": max(0, self.pending - self.workers), "rendered": self.rendered,
+                "rejected": self.rejected, "failed": self.failed,
+                "p50_ms": percentile(0.5), "p95_ms": percentile(0.95)}
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,84 @@
+import asyncio
+import datetime
+import typing
+
+import discord
+
+
+def is_held(category: discord.CategoryChannel) -> bool:
+    # b!hold gives the reviewer their own overwrite.
+    return any(isinstance(target, discord.Member) and not target.bot for target in category.overwrites)
+
+
+class ReviewReminders:
+    """ A timer per test category that reminds its reviewers once a bot has been waiting `after`
+        without the category being on hold, and every `every` after that.
+
+        The timers are armed when the category is created, cancelled when it's put on hold or the
+        bot leaves and armed again when it's unheld. Who invited a bot is looked up once and kept.
+    """
+
+    def __init__(self, bot, after: datetime.timedelta = datetime.timedelta(hours = 2),
+                 every: datetime.timedelta = datetime.timedelta(hours = 1)) -> None:
+        self.bot = bot
+        self.after = after
+        self.every = every
+        self.inviters: typing.Dict[int, typing.Optional[discord.abc.User]] = {}  # bot id -> who added it
+        self._timers: typing.Dict[int, asyncio.Task] = {}  # category id -> timer
+
+    async def inviter(self, member: discord.Member) -> typing.Optional[discord.abc.User]:
+        if member.id not in self.inviters:
+            inviter = None
+            try:
+                async for entry in member.guild.audit_logs(limit = 25, action = discord.AuditLogAction.bot_add):
+                    if entry.target is not None and entry.target.id == member.id:
+                        inviter = entry.user
+                        break
+            except discord.HTTPException:
+                pass
+            self.inviters[member.id] = inviter
+        return self.inviters[member.id]
+
+    def arm(self, category: discord.CategoryChannel, bot_id: int, restart: bool = False) -> None:
+        """ Starts the timer of a category, counting from its creation or from now if `restart`. """
+        self.cancel(category.id)
+        start = datetime.datetime.utcnow() if restart else category.created_at
+        self._timers[category.id] = self.bot.loop.create_task(
+            self._remind(category.id, bot_id, start + self.after))
+
+    def cancel(self, category_id: typing.Optional[int]) -> None:
+        timer = self._timers.pop(category_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def cancel_all(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+
+    async def _remind(self, category_id: int, bot_id: int, deadline: datetime.datetime) -> None:
+        try:
+            while True:
+                await asyncio.sleep(max((deadline - datetime.datetime.utcnow()).total_seconds(), 0))
+                category = self.bot.verification_guild.get_channel(category_id)
+                bot_member = self.bot.verification_guild.get_member(bot_id)
+                if category is None or bot_member is None or is_held(category):
+                    return
+
+                inviter = await self.inviter(bot_member)
+                invited_by = f" (Invited by {inviter.mention})" if inviter else ""
+                testing_hours = int((datetime.datetime.utcnow() - category.created_at).total_seconds() // 3600)
+                for channel in category.text_channels:
+                    try:
+                        await channel.send(
+                            f"Friendly reminder that {bot_member.mention}{invited_by} has been waiting for "
+                            f"more than {testing_hours} hours without the category being on hold "
+                            f"via the `b!hold` command. Please use that command if you are waiting for a "
+                            "response or mention someone who can take over the review from you."
+                        )
+                    except discord.HTTPException:
+                        pass
+                deadline = datetime.datetime.utcnow() + self.every
+        finally:
+            if self._timers.get(category_id) is asyncio.current_task():
+                del self._timers[category_id]
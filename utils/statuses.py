@@ -0,0 +1,50 @@
+import typing
+
+import discord
+
+
+class StatusBuffer:
+    """ Write-behind store for the status of listed bots.
+
+        Presence updates only touch memory, the latest status of every bot that changed
+        is written back to main_site_bot with one statement per flush.
+    """
+
+    flush_query = """
+        UPDATE main_site_bot AS b
+        SET status = u.status
+        FROM unnest($1::bigint[], $2::text[]) AS u(id, status)
+        WHERE b.id = u.id AND b.status IS DISTINCT FROM u.status
+    """
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.dirty: typing.Dict[int, str] = {}  # bot id -> status
+
+    def mark(self, member: discord.Member) -> None:
+        self.dirty[member.id] = str(member.status)
+
+    async def flush(self) -> int:
+        """ Writes every pending status in one statement, returns the amount of rows changed. """
+        if not self.dirty:
+            return 0
+
+        dirty, self.dirty = self.dirty, {}
+        try:
+            result = await self.bot.pool.execute(self.flush_query, list(dirty), list(dirty.values()))
+        except Exception:
+            # keep them around for the next flush, unless there's a newer status already.
+            self.dirty = {**dirty, **self.dirty}
+            raise
+        return int(result.split()[-1])
+
+    async def reconcile(self) -> int:
+        """ Compares every approved bot with the guild and writes the ones that differ,
+            in case a presence update was missed. Bots that aren't in the guild are skipped.
+        """
+        rows = await self.bot.pool.fetch("SELECT id, status FROM main_site_bot WHERE approved = True")
+        for row in rows:
+            member = self.bot.main_guild.get_member(row['id'])
+            if member is not None and str(member.status) != row['status']:
+                self.mark(member)
+        return await self.flush()